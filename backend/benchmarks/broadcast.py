@@ -0,0 +1,76 @@
+"""
+CPU cost of encoding a broadcast frame per recipient vs once per broadcast.
+
+Assuming that you are in the chatapp root directory:
+
+    PYTHONPATH=backend python3 backend/benchmarks/broadcast.py
+"""
+
+import json
+import time
+import asyncio
+
+import src.utils.utils as utils
+
+# A typical send_message event
+PAYLOAD = {
+    "id": 123456,
+    "sender_username": "hizz",
+    "conversation_id": 42,
+    "reply_id": None,
+    "content": "hello there, this is a typical chat message " * 3,
+    "sent_at": 1739458775,
+}
+
+
+class SinkWS:
+    # Same encoding work as aiohttp's WebSocketResponse, without the network
+    async def send_json(self, data, dumps=json.dumps):
+        await self.send_str(dumps(data))
+
+    async def send_str(self, data):
+        pass
+
+
+async def per_recipient(wss):
+    # Every recipient encodes the frame, as send_data does
+    payload = {"success": True, "type": "send_message", "data": PAYLOAD}
+    await asyncio.wait([asyncio.ensure_future(ws.send_json(payload)) for ws in wss])
+
+
+async def serialize_once(wss):
+    # The frame is encoded once and shared, as utils.broadcast does
+    frame = json.dumps({"success": True, "type": "send_message", "data": PAYLOAD})
+    await asyncio.wait([asyncio.ensure_future(ws.send_str(frame)) for ws in wss])
+
+
+async def broadcast(wss):
+    # The full broadcast path, including metrics
+    await utils.broadcast(wss, "send_message", PAYLOAD)
+
+
+def bench(fn, wss, rounds: int) -> float:
+    loop = asyncio.new_event_loop()
+    start = time.process_time()
+    for _ in range(rounds):
+        loop.run_until_complete(fn(wss))
+    elapsed = time.process_time() - start
+    loop.close()
+    return elapsed / rounds
+
+
+if __name__ == "__main__":
+    print(
+        f"{'members':>8} {'per-recipient':>15} {'serialize-once':>15} "
+        f"{'saved':>8} {'broadcast':>15}"
+    )
+    for members in (10, 100, 1000):
+        wss = [SinkWS() for _ in range(members)]
+        rounds = max(10, 20000 // members)
+        old = bench(per_recipient, wss, rounds)
+        new = bench(serialize_once, wss, rounds)
+        full = bench(broadcast, wss, rounds)
+        print(
+            f"{members:>8} {old * 1e6:>13.1f}us {new * 1e6:>13.1f}us "
+            f"{(1 - new / old) * 100:>7.1f}% {full * 1e6:>13.1f}us"
+        )
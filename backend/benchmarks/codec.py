@@ -0,0 +1,99 @@
+"""
+Encode/decode CPU of the json codecs, on the payloads that the server
+handles the most: send_message events and get_messages responses.
+
+Assuming that you are in the chatapp root directory:
+
+    PYTHONPATH=backend python3 backend/benchmarks/codec.py
+
+orjson is optional, without it only the json module is measured.
+"""
+
+import time
+
+import src.utils.codec as codec
+
+
+def send_message_event(content: str) -> dict:
+    # What a client sends
+    return {
+        "type": "send_message",
+        "conversation_id": 42,
+        "reply_id": 1739458700,
+        "content": content,
+    }
+
+
+def send_message_broadcast(content: str) -> dict:
+    # What every member of the conversation receives
+    return {
+        "success": True,
+        "type": "send_message",
+        "data": {
+            "id": 1739458775,
+            "conversation_id": 42,
+            "sender_username": "user1",
+            "reply_id": 1739458700,
+            "content": content,
+            "sent_at": 1739458775,
+        },
+    }
+
+
+def history_page(size: int, content: str) -> dict:
+    # A get_messages response with size messages
+    return {
+        "success": True,
+        "type": "get_messages",
+        "data": {
+            "conversation_id": 42,
+            "has_more": True,
+            "messages": [
+                {
+                    "id": 1739458775 + i,
+                    "sender_username": f"user{i % 7}",
+                    "reply_id": None if i % 5 else 1739458700 + i,
+                    "content": content,
+                    "sent_at": 1739458775 + i * 13,
+                }
+                for i in range(size)
+            ],
+        },
+    }
+
+
+def bench(fn, arg, rounds: int) -> float:
+    start = time.process_time()
+    for _ in range(rounds):
+        fn(arg)
+    return (time.process_time() - start) / rounds
+
+
+if __name__ == "__main__":
+    codecs = [codec.JSON]
+    if codec.orjson is not None:
+        codecs.append(codec.ORJSON)
+    else:
+        print("orjson is not installed, only json is measured")
+
+    short = "hello there, how are you?"
+    long = "a typical longer chat message, with some ünïcode 👋 " * 10
+    payloads = [
+        ("event", send_message_event(short), 50000),
+        ("broadcast", send_message_broadcast(short), 50000),
+        ("broadcast long", send_message_broadcast(long), 50000),
+        ("100 short", history_page(100, short), 2000),
+        ("100 long", history_page(100, long), 2000),
+        ("500 short", history_page(500, short), 400),
+    ]
+
+    print(f"{'payload':>14} {'codec':>8} {'encode':>12} {'decode':>12}")
+    for label, payload, rounds in payloads:
+        for name in codecs:
+            codec.use(name)
+            text = codec.dumps(payload)
+            encode = bench(codec.dumps, payload, rounds)
+            decode = bench(codec.loads, text, rounds)
+            print(
+                f"{label:>14} {name:>8} {encode * 1e6:>10.2f}us {decode * 1e6:>10.2f}us"
+            )
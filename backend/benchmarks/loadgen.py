@@ -0,0 +1,296 @@
+"""
+Websocket load generator: end-to-end delivery latency, throughput and server
+CPU of one backend process under a steady send_message load.
+
+Assuming that you are in the chatapp root directory:
+
+    PYTHONPATH=backend python3 backend/benchmarks/loadgen.py > result.json
+
+The server is created from create_app in a child process, with its database
+in a temporary directory, so the load generator doesn't eat its CPU. Every
+other environment variable of the backend (ex: DB_BATCH_WINDOW_MS) is passed
+on to it. Then USERS users are registered, each one opens a websocket, and
+they are split into conversations of CONVERSATION_SIZE members.
+
+Messages are sent at RATE per second in total, from random users, for
+DURATION seconds after WARMUP seconds. The send times are scheduled ahead
+(open loop), and latencies are measured from the scheduled time, so a
+stalled server shows up as latency instead of as a lower send rate.
+
+- delivery: from sending a message to every other member receiving it
+- ack: from sending a message to the sender receiving it back
+
+The result is printed as json on stdout, the progress goes to stderr.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import tempfile
+import multiprocessing
+
+import aiohttp
+from aiohttp import web
+
+from src.app import create_app
+
+USERS = int(os.environ.get("USERS", "100"))
+CONVERSATION_SIZE = int(os.environ.get("CONVERSATION_SIZE", "5"))
+RATE = float(os.environ.get("RATE", "200"))  # messages per second, in total
+DURATION = float(os.environ.get("DURATION", "10"))  # seconds measured
+WARMUP = float(os.environ.get("WARMUP", "2"))  # seconds not measured
+MESSAGE_SIZE = int(os.environ.get("MESSAGE_SIZE", "64"))  # characters
+DRAIN_TIMEOUT = 5.0  # seconds to wait for the last deliveries
+CONCURRENCY = 16  # registrations and logins at once, they hash passwords
+PASSWORD = "loadgen password"
+
+
+def log(message: str):
+    print(message, file=sys.stderr, flush=True)
+
+
+def run_server(db_dir: str, ports: multiprocessing.Queue, stop):
+    os.environ["DBPATH"] = os.path.join(db_dir, "loadgen.db")
+    # stdout is only for the result
+    sys.stdout = sys.stderr
+
+    async def handle_cpu(request: web.Request):
+        # CPU of the whole server process, the db threads included
+        return web.json_response({"cpu": time.process_time()})
+
+    async def serve():
+        app = create_app()
+        app.router.add_get("/loadgen/cpu", handle_cpu)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        ports.put(runner.addresses[0][1])
+
+        # Serve till the load generator is done
+        await asyncio.get_running_loop().run_in_executor(None, stop.wait)
+        await runner.cleanup()
+
+    asyncio.run(serve())
+
+
+def percentiles(values: list) -> dict:
+    # Milliseconds, nearest-rank
+    if len(values) == 0:
+        return None
+    values = sorted(values)
+
+    def rank(q: float) -> float:
+        index = min(len(values) - 1, max(0, int(q * len(values) + 0.5) - 1))
+        return round(values[index] * 1000, 3)
+
+    return {
+        "p50": rank(0.50),
+        "p95": rank(0.95),
+        "p99": rank(0.99),
+        "max": round(values[-1] * 1000, 3),
+    }
+
+
+class LoadGen:
+    def __init__(self, url: str, session: aiohttp.ClientSession):
+        self.url = url
+        self.session = session
+        self.tokens: dict[str, str] = {}
+        self.wss: dict[str, aiohttp.ClientWebSocketResponse] = {}
+        self.members: dict[int, list[str]] = {}  # conversation id -> usernames
+        self.conversations: dict[str, int] = {}  # username -> conversation id
+        self.created = {}  # conversation name -> future of its id
+        self.sent: dict[int, tuple] = {}  # seq -> (scheduled time, sender, measured)
+        self.pending = 0  # deliveries not received yet
+        self.delivery = []
+        self.ack = []
+        self.errors = 0
+        self.done = asyncio.Event()
+
+    async def login(self, username: str, semaphore: asyncio.Semaphore):
+        async with semaphore:
+            async with self.session.post(
+                f"{self.url}/register",
+                json={"username": username, "password": PASSWORD, "fullname": username},
+            ) as res:
+                if res.status != 201:
+                    raise RuntimeError(f"register {username}: {await res.text()}")
+            async with self.session.post(
+                f"{self.url}/auth/login",
+                json={"username": username, "password": PASSWORD},
+            ) as res:
+                if res.status != 202:
+                    raise RuntimeError(f"login {username}: {await res.text()}")
+                self.tokens[username] = res.cookies["login-token"].value
+
+    async def connect(self, username: str):
+        self.wss[username] = await self.session.ws_connect(
+            f"{self.url}/ws", headers={"Cookie": f"login-token={self.tokens[username]}"}
+        )
+
+    async def read(self, username: str):
+        async for msg in self.wss[username]:
+            if msg.type != aiohttp.WSMsgType.TEXT:
+                continue
+            now = time.perf_counter()
+            event = json.loads(msg.data)
+            if not event["success"]:
+                self.errors += 1
+                log(f"{username}: {event}")
+            elif event["type"] == "send_message":
+                self.received(username, event["data"], now)
+            elif event["type"] == "create_conversation":
+                future = self.created.get(event["data"]["name"], None)
+                if future is not None and not future.done():
+                    future.set_result(event["data"]["id"])
+
+    def received(self, username: str, message: dict, now: float):
+        seq = int(message["content"].split(" ", 1)[0])
+        scheduled, sender, measured = self.sent[seq]
+        if username == sender:
+            if measured:
+                self.ack.append(now - scheduled)
+            return
+        if measured:
+            self.delivery.append(now - scheduled)
+        self.pending -= 1
+        if self.pending == 0:
+            self.done.set()
+
+    async def create_conversations(self):
+        usernames = sorted(self.tokens)
+        for i in range(0, len(usernames), CONVERSATION_SIZE):
+            group = usernames[i : i + CONVERSATION_SIZE]
+            name = f"loadgen{i}"
+            self.created[name] = asyncio.get_running_loop().create_future()
+            await self.wss[group[0]].send_json(
+                {"type": "create_conversation", "name": name, "members": group[1:]}
+            )
+            convo_id = await self.created[name]
+            self.members[convo_id] = group
+            for username in group:
+                self.conversations[username] = convo_id
+
+    async def send(self, seq: int, username: str, scheduled: float, measured: bool):
+        convo_id = self.conversations[username]
+        self.sent[seq] = (scheduled, username, measured)
+        self.pending += len(self.members[convo_id]) - 1
+        content = f"{seq} ".ljust(MESSAGE_SIZE, "x")
+        await self.wss[username].send_json(
+            {"type": "send_message", "conversation_id": convo_id, "content": content}
+        )
+
+    async def drive(self, rng: random.Random) -> tuple:
+        # Open loop: the message i is due at start + i / RATE, however late
+        # the previous ones were
+        usernames = sorted(self.conversations)
+        start = time.perf_counter()
+        measure_from = start + WARMUP
+        end = measure_from + DURATION
+        seq = 0
+        measured = 0
+        while True:
+            scheduled = start + seq / RATE
+            if scheduled >= end:
+                break
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            is_measured = scheduled >= measure_from
+            await self.send(seq, rng.choice(usernames), scheduled, is_measured)
+            measured += is_measured
+            seq += 1
+        return measured, time.perf_counter() - measure_from
+
+    async def server_cpu(self) -> float:
+        async with self.session.get(f"{self.url}/loadgen/cpu") as res:
+            return (await res.json())["cpu"]
+
+
+async def main(url: str) -> dict:
+    rng = random.Random(42)
+    jar = aiohttp.DummyCookieJar()  # every user sends its own cookie
+    connector = aiohttp.TCPConnector(limit=0)
+    async with aiohttp.ClientSession(cookie_jar=jar, connector=connector) as session:
+        gen = LoadGen(url, session)
+
+        log(f"registering {USERS} users ...")
+        semaphore = asyncio.Semaphore(CONCURRENCY)
+        await asyncio.gather(*[gen.login(f"user{i}", semaphore) for i in range(USERS)])
+        await asyncio.gather(*[gen.connect(username) for username in gen.tokens])
+        readers = [asyncio.create_task(gen.read(username)) for username in gen.wss]
+        await gen.create_conversations()
+
+        log(f"sending {RATE:g} messages/s for {WARMUP:g}s + {DURATION:g}s ...")
+        client_cpu = time.process_time()
+        sending = asyncio.create_task(gen.drive(rng))
+        await asyncio.sleep(WARMUP)
+        server_cpu = await gen.server_cpu()
+        measured, elapsed = await sending
+        server_cpu = await gen.server_cpu() - server_cpu
+        client_cpu = time.process_time() - client_cpu
+
+        # Wait for the messages still on their way
+        gen.done.clear()
+        if gen.pending > 0:
+            try:
+                await asyncio.wait_for(gen.done.wait(), DRAIN_TIMEOUT)
+            except asyncio.TimeoutError:
+                pass
+
+        for ws in gen.wss.values():
+            await ws.close()
+        await asyncio.gather(*readers, return_exceptions=True)
+
+    expected = sum(
+        len(gen.members[gen.conversations[sender]]) - 1
+        for _, sender, is_measured in gen.sent.values()
+        if is_measured
+    )
+    return {
+        "config": {
+            "users": USERS,
+            "conversation_size": CONVERSATION_SIZE,
+            "rate": RATE,
+            "duration": DURATION,
+            "warmup": WARMUP,
+            "message_size": MESSAGE_SIZE,
+        },
+        "messages_sent": measured,
+        "deliveries_expected": expected,
+        "deliveries_received": len(gen.delivery),
+        "deliveries_lost": expected - len(gen.delivery),
+        "errors": gen.errors,
+        "throughput": {
+            "messages_per_second": round(measured / elapsed, 1),
+            "deliveries_per_second": round(len(gen.delivery) / elapsed, 1),
+        },
+        "latency_ms": {
+            "delivery": percentiles(gen.delivery),
+            "ack": percentiles(gen.ack),
+        },
+        "cpu": {
+            "server_seconds": round(server_cpu, 3),
+            "server_percent": round(server_cpu / elapsed * 100, 1),
+            "client_percent": round(client_cpu / elapsed * 100, 1),
+        },
+    }
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as db_dir:
+        ports = multiprocessing.Queue()
+        stop = multiprocessing.Event()
+        server = multiprocessing.Process(target=run_server, args=(db_dir, ports, stop))
+        server.start()
+        try:
+            port = ports.get(timeout=30)
+            result = asyncio.run(main(f"http://127.0.0.1:{port}"))
+        finally:
+            stop.set()
+            server.join()
+    print(json.dumps(result, indent=2))
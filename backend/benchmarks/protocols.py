@@ -0,0 +1,67 @@
+"""
+Encode/decode CPU and bytes on the wire of the websocket wire formats, for
+typical history pages (get_messages responses).
+
+Assuming that you are in the chatapp root directory:
+
+    PYTHONPATH=backend python3 backend/benchmarks/protocols.py
+
+msgpack is optional, without it only json is measured.
+"""
+
+import time
+
+import src.utils.protocols as protocols
+
+
+def history_page(size: int, content: str) -> dict:
+    # A get_messages response with size messages
+    return {
+        "success": True,
+        "type": "get_messages",
+        "data": {
+            "conversation_id": 42,
+            "has_more": True,
+            "messages": [
+                {
+                    "id": 1739458775 + i,
+                    "sender_username": f"user{i % 7}",
+                    "reply_id": None if i % 5 else 1739458700 + i,
+                    "content": content,
+                    "sent_at": 1739458775 + i * 13,
+                }
+                for i in range(size)
+            ],
+        },
+    }
+
+
+def bench(fn, arg, rounds: int) -> float:
+    start = time.process_time()
+    for _ in range(rounds):
+        fn(arg)
+    return (time.process_time() - start) / rounds
+
+
+if __name__ == "__main__":
+    formats = [protocols.JSON]
+    if protocols.msgpack is not None:
+        formats.append(protocols.MSGPACK)
+    else:
+        print("msgpack is not installed, only json is measured")
+
+    print(f"{'page':>12} {'format':>8} {'bytes':>8} {'encode':>12} {'decode':>12}")
+    for name, page in [
+        ("100 short", history_page(100, "hello there, how are you?")),
+        ("100 long", history_page(100, "a typical longer chat message " * 10)),
+        ("500 short", history_page(500, "hello there, how are you?")),
+    ]:
+        for protocol in formats:
+            payload = protocols.encode(protocol, page)
+            rounds = 2000 if "100" in name else 400
+            encode = bench(lambda p: protocols.encode(protocol, p), page, rounds)
+            decode = bench(protocols.decode, payload, rounds)
+            print(
+                f"{name:>12} {protocol:>8} {len(payload):>8} "
+                f"{encode * 1e6:>10.1f}us {decode * 1e6:>10.1f}us"
+            )
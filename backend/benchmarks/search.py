@@ -0,0 +1,150 @@
+"""
+Message search with the FTS5 index vs a LIKE scan, on a generated corpus.
+
+Assuming that you are in the chatapp root directory:
+
+    PYTHONPATH=backend python3 backend/benchmarks/search.py
+
+ROWS sets the number of messages, defaults to 2 million. The corpus is
+created in a temporary directory and removed at the end.
+
+The LIKE query only scans the messages of the user's conversations, and
+stops at the first 20 hits without ranking. So it is cheap for common words
+and small users, and gets slow for rare words in large conversations.
+"""
+
+import os
+import time
+import random
+import itertools
+import sqlite3
+import tempfile
+import statistics
+
+import src.configs.migrations as migrations
+import src.utils.utils as utils
+
+ROWS = int(os.environ.get("ROWS", "2000000"))
+USERS = 1000
+CONVERSATIONS = 20000
+MEMBERS = 3  # per conversation
+HEAVY = 500  # conversations of the heavy user, user 1 has ~60
+VOCABULARY = 20000
+WORDS = 12  # per message
+ROUNDS = 20
+
+# Zipf like word frequencies, like in real text a few words are everywhere
+rng = random.Random(42)
+vocabulary = [f"w{i}" for i in range(VOCABULARY)]
+cum_weights = list(itertools.accumulate(1 / (i + 1) for i in range(VOCABULARY)))
+
+
+def populate(db: sqlite3.Connection):
+    db.execute("BEGIN")
+    db.executemany(
+        "INSERT INTO users(username, fullname, password) VALUES (?, ?, 'x')",
+        [(f"user{i}", f"user{i}") for i in range(USERS)],
+    )
+    db.executemany(
+        "INSERT INTO conversations(name) VALUES (?)",
+        [(f"convo{i}",) for i in range(CONVERSATIONS)],
+    )
+    members = set()
+    for convo_id in range(1, CONVERSATIONS + 1):
+        for user_id in rng.sample(range(1, USERS + 1), MEMBERS):
+            members.add((convo_id, user_id))
+    # The last user is in a lot of conversations
+    for convo_id in rng.sample(range(1, CONVERSATIONS + 1), HEAVY):
+        members.add((convo_id, USERS))
+    db.executemany("INSERT INTO members VALUES (?, ?)", sorted(members))
+    db.execute("COMMIT")
+
+    # The triggers index every message as it is inserted
+    start = time.perf_counter()
+    batch = 50000
+    for offset in range(0, ROWS, batch):
+        rows = []
+        for _ in range(min(batch, ROWS - offset)):
+            convo_id = rng.randint(1, CONVERSATIONS)
+            content = " ".join(
+                rng.choices(vocabulary, cum_weights=cum_weights, k=WORDS)
+            )
+            rows.append((rng.randint(1, USERS), convo_id, content))
+        db.execute("BEGIN")
+        db.executemany(
+            "INSERT INTO messages(sender_id, conversation_id, content) VALUES (?, ?, ?)",
+            rows,
+        )
+        db.execute("COMMIT")
+    return time.perf_counter() - start
+
+
+def user_conversations(db: sqlite3.Connection, user_id: int):
+    # As the membership cache gives them to the search event
+    return sorted(
+        r[0]
+        for r in db.execute(
+            "SELECT conversation_id FROM members WHERE user_id = ?", [user_id]
+        )
+    )
+
+
+def like_search(db: sqlite3.Connection, user_id: int, word: str, limit: int):
+    # What search would be without the index
+    return db.execute(
+        "SELECT messages.id FROM messages, members "
+        "WHERE members.conversation_id = messages.conversation_id AND members.user_id = ? "
+        "AND messages.content LIKE ? ORDER BY messages.id DESC LIMIT ?",
+        [user_id, f"%{word}%", limit],
+    ).fetchall()
+
+
+def bench(fn, *args) -> float:
+    timings = []
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        fn(*args)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as tmpdir:
+        db_path = os.path.join(tmpdir, "search.db")
+        db = sqlite3.connect(db_path, isolation_level=None)
+        db.execute("PRAGMA journal_mode = WAL")
+        db.execute("PRAGMA synchronous = NORMAL")
+        migrations.migrate(db)
+
+        print(f"generating {ROWS} messages ...")
+        elapsed = populate(db)
+        size = os.path.getsize(db_path) / 1024 / 1024
+        print(
+            f"inserted in {elapsed:.1f}s ({ROWS / elapsed:.0f} rows/s), "
+            f"database {size:.0f}MiB"
+        )
+
+        start = time.perf_counter()
+        utils.rebuild_search_index(db)
+        print(f"offline rebuild in {time.perf_counter() - start:.1f}s")
+
+        # Common, medium and rare words, for a typical and a heavy user
+        print(
+            f"{'user':>6} {'word':>6} {'matches':>9} {'fts5':>12} {'like':>12} "
+            f"{'speedup':>8}"
+        )
+        for user_id in (1, USERS):
+            convo_ids = user_conversations(db, user_id)
+            for word in ("w0", "w100", "w5000"):
+                matches = db.execute(
+                    "SELECT COUNT(*) FROM messages_fts WHERE messages_fts MATCH ?",
+                    [utils.to_match_query(word)],
+                ).fetchone()[0]
+                fts = bench(utils.search_messages, db, user_id, word, convo_ids, 0, 20)
+                like = bench(like_search, db, user_id, word, 20)
+                print(
+                    f"{user_id:>6} {word:>6} {matches:>9} {fts * 1000:>10.2f}ms "
+                    f"{like * 1000:>10.2f}ms {like / fts:>7.1f}x"
+                )
+
+        db.close()
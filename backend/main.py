@@ -1,13 +1,14 @@
 import os
+import multiprocessing
 
 from aiohttp import web
 import aiohttp_cors
 
 from src.app import create_app
+from src.utils.broker import run_broker
 
-if __name__ == "__main__":
-    app = create_app()
 
+def setup_cors(app: web.Application):
     # Get CORS_ALLOW_ORIGIN environment variable
     CORS_ALLOW_ORIGIN = os.environ.get("CORS_ALLOW_ORIGIN", "http://localhost:5173")
 
@@ -27,4 +28,50 @@ if __name__ == "__main__":
     for route in list(app.router.routes()):
         cors.add(route)
 
-    web.run_app(app, port=8000)
+
+def run_worker(worker: int, bus_path: str):
+    # The bus config of the app picks these up
+    os.environ["WORKER_ID"] = str(worker)
+    os.environ["BUS_PATH"] = bus_path
+
+    app = create_app()
+    setup_cors(app)
+
+    # All the workers listen on the same port, the kernel spreads the
+    # connections between them
+    web.run_app(app, port=8000, reuse_port=True, print=None)
+
+
+if __name__ == "__main__":
+    # Get the number of worker processes, one per CPU core is a good start
+    WORKERS = int(os.environ.get("WORKERS", "1"))
+
+    if WORKERS <= 1:
+        app = create_app()
+        setup_cors(app)
+        web.run_app(app, port=8000)
+    else:
+        # Workers reach each others users through the local broker
+        BUS_PATH = os.environ.get("BUS_PATH", ".data/bus.sock")
+        os.makedirs(os.path.dirname(BUS_PATH) or ".", exist_ok=True)
+
+        broker = multiprocessing.Process(target=run_broker, args=(BUS_PATH,))
+        broker.start()
+        workers = [
+            multiprocessing.Process(target=run_worker, args=(i + 1, BUS_PATH))
+            for i in range(WORKERS)
+        ]
+        for worker in workers:
+            worker.start()
+        print(f"======== Running {WORKERS} workers on http://0.0.0.0:8000 ========")
+
+        try:
+            for worker in workers:
+                worker.join()
+        except KeyboardInterrupt:
+            # The workers get the same interrupt and shut down on their own
+            for worker in workers:
+                worker.join()
+        finally:
+            broker.terminate()
+            broker.join()
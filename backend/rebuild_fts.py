@@ -0,0 +1,35 @@
+"""
+Rebuild the message search index from the messages table, ex: after a
+bulk import that bypassed the triggers, or to merge the index segments.
+Stop the backend first, the rebuild holds the write lock.
+
+Assuming that you are in the chatapp root directory:
+
+    cd backend && DBPATH=.data/chatapp.db python3 rebuild_fts.py
+"""
+
+import os
+import time
+import sqlite3
+
+import src.configs.migrations as migrations
+import src.utils.utils as utils
+
+if __name__ == "__main__":
+    # Get the database path
+    db_path = os.environ.get("DBPATH", ".data/chatapp.db")
+    if not os.path.exists(db_path):
+        print(f"no database at '{db_path}'")
+        exit(1)
+
+    db = sqlite3.connect(db_path, isolation_level=None)
+
+    # The search index is created by the migrations
+    migrations.migrate(db)
+
+    start = time.perf_counter()
+    utils.rebuild_search_index(db)
+    rows = db.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+    print(f"indexed {rows} messages in {time.perf_counter() - start:.2f}s")
+
+    db.close()
@@ -1,9 +1,17 @@
 from aiohttp import web
 
+import src.configs.batcher as batcher_config
+import src.configs.bus as bus_config
+import src.configs.codec as codec_config
 import src.configs.db as db_config
 import src.configs.jwt as jwt_config
+import src.configs.members as members_config
+import src.configs.metrics as metrics_config
+import src.configs.outbox as outbox_config
 import src.configs.passhasher as passhasher_config
+import src.configs.presence as presence_config
 import src.configs.ws as ws_config
+import src.routes.metrics as metrics_routes
 import src.routes.misc as misc_routes
 import src.routes.register as register_routes
 import src.routes.auth as auth_routes
@@ -14,14 +22,24 @@ def create_app():
     app = web.Application()
 
     # Add startup and shutdown contexts
+    app.cleanup_ctx.append(codec_config.codec_ctx)
     app.cleanup_ctx.append(db_config.db_ctx)
+    app.cleanup_ctx.append(members_config.members_ctx)
+    app.cleanup_ctx.append(batcher_config.batcher_ctx)
     app.cleanup_ctx.append(jwt_config.jwt_ctx)
     app.cleanup_ctx.append(passhasher_config.passhasher_ctx)
+    app.cleanup_ctx.append(outbox_config.outbox_ctx)
     app.cleanup_ctx.append(ws_config.wss_ctx)
+    app.cleanup_ctx.append(bus_config.bus_ctx)
+    app.cleanup_ctx.append(presence_config.presence_ctx)
+    app.cleanup_ctx.append(metrics_config.metrics_ctx)
 
     # Add misc routes
     app.router.add_get("/misc/ping", misc_routes.handle_ping)
 
+    # Add metrics routes
+    app.router.add_get("/metrics", metrics_routes.handle_metrics)
+
     # Add register routes
     app.router.add_post("/register", register_routes.handle_register)
 
@@ -0,0 +1,117 @@
+import os
+import time
+import asyncio
+
+from aiohttp import web
+
+from src.configs.db import ADB_KEY, AsyncDB
+import src.utils.utils as utils
+import src.utils.metrics as metrics
+
+BATCH_SIZE = metrics.histogram(
+    "chatapp_message_batch_rows",
+    "Number of messages committed per transaction",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512),
+)
+BATCH_COMMIT_LATENCY = metrics.histogram(
+    "chatapp_message_batch_commit_seconds",
+    "Time taken to commit one batch of messages",
+)
+
+
+class MessageBatcher:
+    """
+    Group commit for message inserts. Messages added within window seconds
+    of each other, up to max_rows, are inserted in a single transaction, so
+    many senders share one fsync. Every sender gets its own message id back.
+
+    With window set to 0 every message is committed on its own.
+    """
+
+    def __init__(self, adb: AsyncDB, window: float, max_rows: int):
+        self.adb = adb
+        self.window = window
+        self.max_rows = max_rows
+        self._rows = []
+        self._futures = []
+        self._timer = None
+        self._flushes = set()  # Running flush tasks
+
+    async def add_message(
+        self,
+        conversation_id: int,
+        content: str,
+        reply_id: int,
+        sender_id: int,
+        sent_at: int,
+    ):
+        row = (conversation_id, content, reply_id, sender_id, sent_at)
+        if self.window <= 0:
+            return (await self._commit([row]))[0]
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._rows.append(row)
+        self._futures.append(future)
+
+        # The first message of a batch starts the window
+        if len(self._rows) >= self.max_rows:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if len(self._rows) == 0:
+            return
+
+        rows, futures = self._rows, self._futures
+        self._rows, self._futures = [], []
+        task = asyncio.ensure_future(self._commit_batch(rows, futures))
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def _commit(self, rows: list) -> list:
+        start = time.perf_counter()
+        message_ids = await self.adb.write(utils.add_messages, rows)
+        BATCH_COMMIT_LATENCY.observe(time.perf_counter() - start)
+        BATCH_SIZE.observe(len(rows))
+        return message_ids
+
+    async def _commit_batch(self, rows: list, futures: list):
+        try:
+            message_ids = await self._commit(rows)
+        except Exception as e:
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for future, message_id in zip(futures, message_ids):
+            if not future.done():
+                future.set_result(message_id)
+
+    async def close(self):
+        # Commit whatever is still waiting for its window
+        self._flush()
+        if len(self._flushes) != 0:
+            await asyncio.wait(self._flushes)
+
+
+BATCHER_KEY = web.AppKey("batcher", MessageBatcher)
+
+
+async def batcher_ctx(app: web.Application):
+    # Get the batching window from environment variables, 0 disables batching
+    window_ms = float(os.environ.get("DB_BATCH_WINDOW_MS", "0"))
+    max_rows = int(os.environ.get("DB_BATCH_MAX_ROWS", "256"))
+
+    batcher = MessageBatcher(app[ADB_KEY], window_ms / 1000, max_rows)
+    app[BATCHER_KEY] = batcher
+
+    yield
+
+    await batcher.close()
@@ -0,0 +1,151 @@
+import os
+import json
+import asyncio
+
+from aiohttp import web
+
+from src.configs.ws import WSS_KEY
+from src.configs.members import MEMBERS_KEY
+import src.utils.codec as codec
+from src.utils.fanout import broadcast_frame
+from src.utils.protocols import JSON, Frame
+
+CONNECT_ATTEMPTS = 50  # the broker might still be starting
+CONNECT_DELAY = 0.1  # seconds between attempts
+
+
+class BusClient:
+    """
+    Connection of a worker to the local broker (src/utils/broker.py).
+
+    Keeps a routing table of the users connected to the other workers, so
+    the fan-out helpers can reach them. Without a broker (single worker mode)
+    the routing table stays empty and every method is a no-op.
+
+    - join/leave: announce the users connected to this worker
+    - deliver: send an encoded frame to the users on other workers
+    - publish: send any other message to all the other workers, which is
+      passed to handlers[op] on the receiving side
+    """
+
+    def __init__(self, worker: int, wss: dict[str, set[web.WebSocketResponse]]):
+        self.worker = worker
+        self.wss = wss
+        self.routes: dict[str, set[int]] = {}  # username -> remote workers
+        self.handlers = {}  # op -> fn(message)
+        self._writer = None
+        self._task = None
+
+    async def connect(self, path: str):
+        for attempt in range(CONNECT_ATTEMPTS):
+            try:
+                reader, writer = await asyncio.open_unix_connection(path)
+                break
+            except (FileNotFoundError, ConnectionRefusedError):
+                if attempt == CONNECT_ATTEMPTS - 1:
+                    raise
+                await asyncio.sleep(CONNECT_DELAY)
+
+        # The broker answers the hello with the current routing table
+        writer.write(codec.dumps({"op": "hello", "worker": self.worker}).encode())
+        writer.write(b"\n")
+        snapshot = codec.loads(await reader.readline())
+        self.routes = {u: set(w) for u, w in snapshot["routes"].items()}
+
+        self._writer = writer
+        self._task = asyncio.create_task(self._listen(reader))
+
+    def _send(self, message: dict):
+        if self._writer is None:
+            return
+        self._writer.write(codec.dumps(message).encode() + b"\n")
+
+    def join(self, username: str):
+        self._send({"op": "join", "username": username})
+
+    def leave(self, username: str):
+        self._send({"op": "leave", "username": username})
+
+    def publish(self, op: str, **fields):
+        self._send({"op": op, **fields})
+
+    def is_remote(self, username: str) -> bool:
+        return username in self.routes
+
+    def is_online(self, username: str) -> bool:
+        return username in self.wss or username in self.routes
+
+    def deliver(self, usernames, frame: Frame):
+        # Group the remote users by worker, one message per worker. Users on
+        # this worker are never in the routes, they are delivered locally
+        targets: dict[int, list[str]] = {}
+        for username in usernames:
+            for worker in self.routes.get(username, ()):
+                targets.setdefault(worker, []).append(username)
+        for worker, names in targets.items():
+            self._send(
+                {
+                    "op": "deliver",
+                    "worker": worker,
+                    "usernames": names,
+                    "frame": frame.encode(JSON),
+                }
+            )
+
+    async def _listen(self, reader: asyncio.StreamReader):
+        try:
+            while line := await reader.readline():
+                self._handle(codec.loads(line))
+        except (ConnectionError, json.JSONDecodeError) as e:
+            print("bus connection closed with exception %s" % e)
+        # Without the broker the other workers can't be reached
+        self.routes.clear()
+        self._writer = None
+
+    def _handle(self, message: dict):
+        op = message.get("op", None)
+        if op == "deliver":
+            recipients = [
+                ws for u in message["usernames"] for ws in self.wss.get(u, ())
+            ]
+            frame = Frame(encoded={JSON: message["frame"]})
+            asyncio.create_task(broadcast_frame(recipients, frame))
+        elif op == "join":
+            self.routes.setdefault(message["username"], set()).add(message["worker"])
+        elif op == "leave":
+            workers = self.routes.get(message["username"], set())
+            workers.discard(message["worker"])
+            if len(workers) == 0:
+                self.routes.pop(message["username"], None)
+        elif op in self.handlers:
+            self.handlers[op](message)
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+BUS_KEY = web.AppKey("bus", BusClient)
+
+
+async def bus_ctx(app: web.Application):
+    # Get the broker socket and the worker id, set by main.py in multi-worker
+    # mode. Without BUS_PATH this worker is on its own.
+    bus_path = os.environ.get("BUS_PATH", None)
+    worker = int(os.environ.get("WORKER_ID", "0"))
+
+    bus = BusClient(worker, app[WSS_KEY])
+    members = app[MEMBERS_KEY]
+    bus.handlers["add_conversation"] = lambda m: members.add_conversation(
+        m["id"], m["members"]
+    )
+    if bus_path is not None:
+        await bus.connect(bus_path)
+    app[BUS_KEY] = bus
+
+    yield
+
+    await bus.close()
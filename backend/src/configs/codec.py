@@ -0,0 +1,13 @@
+import os
+
+from aiohttp import web
+
+import src.utils.codec as codec
+
+
+async def codec_ctx(app: web.Application):
+    # Get the json codec from environment variable, auto uses orjson when it
+    # is installed and the json module otherwise
+    codec.use(os.environ.get("JSON_CODEC", codec.AUTO))
+
+    yield
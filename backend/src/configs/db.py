@@ -1,10 +1,160 @@
 import os
+import time
+import asyncio
+import pathlib
 import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 from aiohttp import web
 
-DB_KEY = web.AppKey("db", sqlite3.Connection)
+import src.configs.migrations as migrations
+import src.utils.metrics as metrics
+
+QUERIES = metrics.counter("chatapp_db_queries_total", "Database calls", ("op", "query"))
+QUERY_LATENCY = metrics.histogram(
+    "chatapp_db_query_seconds",
+    "Time taken by a database call, including the wait for a connection",
+    ("op", "query"),
+)
+
+
+class AsyncDB:
+    """
+    Awaitable access to the sqlite database, so the event loop never blocks
+    on disk I/O.
+
+    - write: runs fn(conn, *args) on a dedicated writer thread, which owns
+      the only read-write connection. Writes are therefore serialized.
+    - read: runs fn(conn, *args) on a small pool of threads, each with its
+      own read-only connection.
+
+    fn is any of the plain sqlite helpers (ex: utils.get_user_info), which
+    take the connection as the first argument.
+    """
+
+    def __init__(
+        self, db_path: str, writer: sqlite3.Connection, profile: dict, readers: int
+    ):
+        self.db_path = db_path
+        self.writer = writer
+        self.profile = profile
+        self._reader_conns = []
+        self._reader_local = threading.local()
+        self._reader_lock = threading.Lock()
+        self._write_executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="db-writer"
+        )
+        self._read_executor = ThreadPoolExecutor(
+            max_workers=readers, thread_name_prefix="db-reader"
+        )
+
+    def _reader(self) -> sqlite3.Connection:
+        # Lazily open a read-only connection per reader thread
+        conn = getattr(self._reader_local, "conn", None)
+        if conn is None:
+            uri = pathlib.Path(self.db_path).resolve().as_uri() + "?mode=ro"
+            conn = sqlite3.connect(
+                uri, uri=True, isolation_level=None, check_same_thread=False
+            )
+            apply_pragmas(conn, self.profile, readonly=True)
+            self._reader_local.conn = conn
+            with self._reader_lock:
+                self._reader_conns.append(conn)
+        return conn
+
+    def _run_read(self, fn, args):
+        return fn(self._reader(), *args)
+
+    def _run_write(self, fn, args):
+        return fn(self.writer, *args)
+
+    async def _run(self, op: str, executor, run, fn, args):
+        loop = asyncio.get_running_loop()
+        query = getattr(fn, "__name__", "unknown")
+        QUERIES.inc(op=op, query=query)
+        start = time.perf_counter()
+        try:
+            return await loop.run_in_executor(executor, run, fn, args)
+        finally:
+            QUERY_LATENCY.observe(time.perf_counter() - start, op=op, query=query)
+
+    async def read(self, fn, *args):
+        return await self._run("read", self._read_executor, self._run_read, fn, args)
+
+    async def write(self, fn, *args):
+        return await self._run("write", self._write_executor, self._run_write, fn, args)
+
+    def close(self):
+        # Wait for all the pending queries, and then close the connections
+        self._read_executor.shutdown(wait=True)
+        self._write_executor.shutdown(wait=True)
+        for conn in self._reader_conns:
+            conn.close()
+        self._reader_conns.clear()
+
+
 DBPATH_KEY = web.AppKey("dbpath", str)
+DBPROFILE_KEY = web.AppKey("dbprofile", dict)
+ADB_KEY = web.AppKey("adb", AsyncDB)
+
+# Storage profiles, selected with the DBPROFILE environment variable
+# - wal: readers don't block the writer, commits only fsync on checkpoint
+# - durable: WAL, but every commit is fsynced
+# - legacy: sqlite defaults, rollback journal
+STORAGE_PROFILES = {
+    "wal": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "mmap_size": 256 * 1024 * 1024,  # bytes
+        "cache_size": -16 * 1024,  # negative values are in KiB
+        "busy_timeout": 5000,  # milliseconds
+        "readers": 4,  # number of read-only connections
+    },
+    "durable": {
+        "journal_mode": "WAL",
+        "synchronous": "FULL",
+        "mmap_size": 256 * 1024 * 1024,
+        "cache_size": -16 * 1024,
+        "busy_timeout": 5000,
+        "readers": 4,
+    },
+    "legacy": {
+        "journal_mode": "DELETE",
+        "synchronous": "FULL",
+        "mmap_size": 0,
+        "cache_size": -2000,
+        "busy_timeout": 5000,
+        "readers": 4,
+    },
+}
+
+
+def get_storage_profile() -> dict:
+    """
+    Get the storage profile from DBPROFILE (defaults to `wal`). Every value of
+    the profile can be overridden with DB_<NAME>, ex: DB_SYNCHRONOUS=FULL
+    """
+    name = os.environ.get("DBPROFILE", "wal")
+    if name not in STORAGE_PROFILES:
+        raise ValueError(f"unknown storage profile '{name}'")
+
+    profile = dict(STORAGE_PROFILES[name])
+    for key, value in profile.items():
+        override = os.environ.get(f"DB_{key.upper()}", None)
+        if override is not None:
+            profile[key] = type(value)(override)
+    return profile
+
+
+def apply_pragmas(db: sqlite3.Connection, profile: dict, readonly: bool = False):
+    # journal_mode is stored in the database file, only the writer sets it
+    if not readonly:
+        db.execute(f"PRAGMA journal_mode = {profile['journal_mode']}")
+        db.execute(f"PRAGMA synchronous = {profile['synchronous']}")
+    db.execute(f"PRAGMA mmap_size = {int(profile['mmap_size'])}")
+    db.execute(f"PRAGMA cache_size = {int(profile['cache_size'])}")
+    db.execute(f"PRAGMA busy_timeout = {int(profile['busy_timeout'])}")
 
 
 async def db_ctx(app: web.Application):
@@ -15,88 +165,32 @@ async def db_ctx(app: web.Application):
     app[DBPATH_KEY] = db_path
 
     # Connect to database
-    db = sqlite3.connect(db_path, isolation_level=None)
-    app[DB_KEY] = db
+    # After startup this connection is owned by the AsyncDB writer thread, so
+    # it is not exposed on the app. Use ADB_KEY for all queries.
+    db = sqlite3.connect(db_path, isolation_level=None, check_same_thread=False)
+
+    # Tune the connection with the storage profile
+    profile = get_storage_profile()
+    apply_pragmas(db, profile)
+    app[DBPROFILE_KEY] = profile
 
-    # Add the required tables
-    cur = db.cursor()
-    cur.execute("BEGIN")
+    # Bring the schema up to date
     try:
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS users(
-                id INTEGER,
-                username TEXT NOT NULL UNIQUE,
-                fullname TEXT NOT NULL,
-                password TEXT NOT NULL,
-                is_online INTEGER NOT NULL DEFAULT 0,
-                last_online INTEGER DEFAULT (unixepoch()),
-                created_at INTEGER DEFAULT (unixepoch()),
-                -- constraints
-                PRIMARY KEY (id)
-            );
-            """
-        )
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS contacts(
-                user_id INTEGER,
-                contact_id INTEGER,
-                -- constraints
-                PRIMARY KEY (user_id, contact_id),
-                FOREIGN KEY (user_id) REFERENCES users(id),
-                FOREIGN KEY (contact_id) REFERENCES users(id)
-            );
-            """
-        )
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS conversations(
-                id INTEGER,
-                name TEXT NOT NULL,
-                -- constraints
-                PRIMARY KEY (id)
-            );
-            """
-        )
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS members(
-                conversation_id INTEGER NOT NULL,
-                user_id INTEGER NOT NULL,
-                -- constraints
-                PRIMARY KEY (conversation_id, user_id),
-                FOREIGN KEY (conversation_id) REFERENCES conversations(id),
-                FOREIGN KEY (user_id) REFERENCES users(id)
-            )
-            """
-        )
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS messages (
-                id INTEGER NOT NULL,
-                sender_id INTEGER NOT NULL,
-                conversation_id INTEGER NOT NULL,
-                reply_id INTEGER,
-                sent_at INTEGER DEFAULT (unixepoch()),
-                content TEXT,
-                -- constraints
-                PRIMARY KEY (id),
-                FOREIGN KEY (sender_id) REFERENCES users(id),
-                FOREIGN KEY (conversation_id) REFERENCES conversations(id),
-                FOREIGN KEY (reply_id) REFERENCES messages(id)
-            )
-            """
-        )
-        cur.execute("COMMIT")
+        timings = migrations.migrate(db)
     except sqlite3.Error as e:
-        cur.execute("ROLLBACK")
         print("Something went wrong while setting up database schema")
         print(e)
         raise e
+    for version, description, elapsed in timings:
+        print(f"applied migration {version} ({description}) in {elapsed * 1000:.2f}ms")
+
+    # Setup the async access layer
+    adb = AsyncDB(db_path, db, profile, profile["readers"])
+    app[ADB_KEY] = adb
 
     # after this yield we have the database shutdown steps
     yield
 
-    # Close database connection
+    # Close database connections
+    adb.close()
     db.close()
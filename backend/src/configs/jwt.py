@@ -1,8 +1,54 @@
 import os
+import time
+import collections
 
+import jwt
 from aiohttp import web
 
+import src.utils.metrics as metrics
+
+TOKEN_CACHE_LOOKUPS = metrics.counter(
+    "chatapp_token_cache_lookups_total", "Verified token cache lookups", ("result",)
+)
+
+
+class TokenCache:
+    """
+    Bounded LRU cache of verified login-tokens, so a token that is seen
+    again (polling /auth/verify, websocket reconnects) skips jwt.decode.
+
+    Only tokens that passed verification are stored, and a cached token is
+    rejected once its exp is reached, exactly like jwt.decode would.
+    """
+
+    def __init__(self, jwtsecret: str, max_size: int):
+        self.jwtsecret = jwtsecret
+        self.max_size = max_size
+        self.tokens = collections.OrderedDict()  # token -> claims
+
+    def decode(self, token: str) -> dict:
+        claims = self.tokens.get(token, None)
+        if claims is not None:
+            exp = claims.get("exp", None)
+            if exp is not None and time.time() >= exp:
+                del self.tokens[token]
+                raise jwt.exceptions.ExpiredSignatureError("Signature has expired")
+            TOKEN_CACHE_LOOKUPS.inc(result="hit")
+            self.tokens.move_to_end(token)
+            return claims
+
+        # Raises jwt.exceptions.InvalidTokenError, nothing is cached then
+        TOKEN_CACHE_LOOKUPS.inc(result="miss")
+        claims = jwt.decode(token, self.jwtsecret, algorithms="HS256")
+        if self.max_size > 0:
+            self.tokens[token] = claims
+            if len(self.tokens) > self.max_size:
+                self.tokens.popitem(last=False)
+        return claims
+
+
 JWT_KEY = web.AppKey("jwt", str)
+TOKEN_CACHE_KEY = web.AppKey("token_cache", TokenCache)
 
 
 async def jwt_ctx(app: web.Application):
@@ -10,4 +56,8 @@ async def jwt_ctx(app: web.Application):
     jwtsecret = os.environ.get("JWTSECRET", "this is a demo jwt secret")
     app[JWT_KEY] = jwtsecret
 
+    # Get the number of verified tokens to remember, 0 disables the cache
+    cache_size = int(os.environ.get("JWT_CACHE_SIZE", "1024"))
+    app[TOKEN_CACHE_KEY] = TokenCache(jwtsecret, cache_size)
+
     yield
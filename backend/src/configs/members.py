@@ -0,0 +1,114 @@
+import sqlite3
+
+from aiohttp import web
+
+from src.configs.db import ADB_KEY, AsyncDB
+import src.utils.metrics as metrics
+
+CACHE_LOOKUPS = metrics.counter(
+    "chatapp_membership_cache_lookups_total",
+    "Membership cache lookups",
+    ("result",),
+)
+
+
+def get_convo_usernames(db: sqlite3.Connection, convo_id: int):
+    cur = db.execute(
+        "SELECT users.username FROM members, users WHERE "
+        "members.user_id = users.id AND members.conversation_id = ?",
+        [convo_id],
+    )
+    return [r[0] for r in cur.fetchall()]
+
+
+def get_user_convo_ids(db: sqlite3.Connection, username: str):
+    cur = db.execute(
+        "SELECT members.conversation_id FROM members, users WHERE "
+        "members.user_id = users.id AND users.username = ?",
+        [username],
+    )
+    return [r[0] for r in cur.fetchall()]
+
+
+class MembershipCache:
+    """
+    In-memory copy of the members table, loaded lazily from the database.
+
+    - conversation id -> member usernames
+    - username -> conversation ids
+
+    Code that changes membership must call add_conversation, or one of the
+    invalidate methods, after the change is committed.
+    """
+
+    def __init__(self, adb: AsyncDB):
+        self.adb = adb
+        self.convo_members: dict[int, set[str]] = {}
+        self.user_convos: dict[str, set[int]] = {}
+        # Bumped on every change, a load that raced with a change is not
+        # stored, as it might have read the members before the change
+        self._generation = 0
+
+    async def get_members(self, convo_id: int) -> set[str]:
+        members = self.convo_members.get(convo_id, None)
+        if members is not None:
+            CACHE_LOOKUPS.inc(result="hit")
+            return members
+
+        CACHE_LOOKUPS.inc(result="miss")
+        generation = self._generation
+        members = set(await self.adb.read(get_convo_usernames, convo_id))
+        if generation == self._generation:
+            self.convo_members[convo_id] = members
+        return members
+
+    async def get_conversations(self, username: str) -> set[int]:
+        convo_ids = self.user_convos.get(username, None)
+        if convo_ids is not None:
+            CACHE_LOOKUPS.inc(result="hit")
+            return convo_ids
+
+        CACHE_LOOKUPS.inc(result="miss")
+        generation = self._generation
+        convo_ids = set(await self.adb.read(get_user_convo_ids, username))
+        if generation == self._generation:
+            self.user_convos[username] = convo_ids
+        return convo_ids
+
+    async def is_member(self, username: str, convo_id: int) -> bool:
+        # Use whichever side is already warm
+        convo_ids = self.user_convos.get(username, None)
+        if convo_ids is not None:
+            CACHE_LOOKUPS.inc(result="hit")
+            return convo_id in convo_ids
+        return username in await self.get_members(convo_id)
+
+    def add_conversation(self, convo_id: int, members):
+        self._generation += 1
+        self.convo_members[convo_id] = set(members)
+        for m in members:
+            convo_ids = self.user_convos.get(m, None)
+            if convo_ids is not None:
+                convo_ids.add(convo_id)
+
+    def invalidate_conversation(self, convo_id: int):
+        self._generation += 1
+        members = self.convo_members.pop(convo_id, set())
+        for m in members:
+            self.user_convos.pop(m, None)
+
+    def invalidate_user(self, username: str):
+        self._generation += 1
+        convo_ids = self.user_convos.pop(username, set())
+        for convo_id in convo_ids:
+            self.convo_members.pop(convo_id, None)
+
+
+MEMBERS_KEY = web.AppKey("members", MembershipCache)
+
+
+async def members_ctx(app: web.Application):
+    # The cache starts empty, and is warmed lazily
+    app[MEMBERS_KEY] = MembershipCache(app[ADB_KEY])
+
+    yield
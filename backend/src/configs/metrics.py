@@ -0,0 +1,37 @@
+import time
+import asyncio
+
+from aiohttp import web
+
+import src.utils.metrics as metrics
+
+LOOP_LAG = metrics.gauge(
+    "chatapp_event_loop_lag_seconds", "Last measured event loop scheduling delay"
+)
+LOOP_LAG_HISTOGRAM = metrics.histogram(
+    "chatapp_event_loop_lag_distribution_seconds", "Event loop scheduling delay"
+)
+
+LOOP_LAG_INTERVAL = 0.5  # seconds between two measurements
+
+
+async def measure_loop_lag(interval: float):
+    # A sleep that wakes up later than asked, waited for a busy event loop
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lag = max(0.0, time.perf_counter() - start - interval)
+        LOOP_LAG.set(lag)
+        LOOP_LAG_HISTOGRAM.observe(lag)
+
+
+async def metrics_ctx(app: web.Application):
+    task = asyncio.create_task(measure_loop_lag(LOOP_LAG_INTERVAL))
+
+    yield
+
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
@@ -0,0 +1,198 @@
+import time
+import sqlite3
+
+# Every migration is (version, description, statements). The database
+# remembers the last applied version in PRAGMA user_version, so each migration
+# runs exactly once. Only ever append to this list.
+MIGRATIONS = [
+    (
+        1,
+        "create tables",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS users(
+                id INTEGER,
+                username TEXT NOT NULL UNIQUE,
+                fullname TEXT NOT NULL,
+                password TEXT NOT NULL,
+                is_online INTEGER NOT NULL DEFAULT 0,
+                last_online INTEGER DEFAULT (unixepoch()),
+                created_at INTEGER DEFAULT (unixepoch()),
+                -- constraints
+                PRIMARY KEY (id)
+            );
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS contacts(
+                user_id INTEGER,
+                contact_id INTEGER,
+                -- constraints
+                PRIMARY KEY (user_id, contact_id),
+                FOREIGN KEY (user_id) REFERENCES users(id),
+                FOREIGN KEY (contact_id) REFERENCES users(id)
+            );
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS conversations(
+                id INTEGER,
+                name TEXT NOT NULL,
+                -- constraints
+                PRIMARY KEY (id)
+            );
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS members(
+                conversation_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                -- constraints
+                PRIMARY KEY (conversation_id, user_id),
+                FOREIGN KEY (conversation_id) REFERENCES conversations(id),
+                FOREIGN KEY (user_id) REFERENCES users(id)
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER NOT NULL,
+                sender_id INTEGER NOT NULL,
+                conversation_id INTEGER NOT NULL,
+                reply_id INTEGER,
+                sent_at INTEGER DEFAULT (unixepoch()),
+                content TEXT,
+                -- constraints
+                PRIMARY KEY (id),
+                FOREIGN KEY (sender_id) REFERENCES users(id),
+                FOREIGN KEY (conversation_id) REFERENCES conversations(id),
+                FOREIGN KEY (reply_id) REFERENCES messages(id)
+            )
+            """,
+        ],
+    ),
+    (
+        2,
+        "add hot-path indexes",
+        [
+            # get_messages: messages of a conversation by id
+            "CREATE INDEX IF NOT EXISTS messages_conversation_id "
+            "ON messages(conversation_id, id)",
+            # get_conversations, has_conversation: conversations of a user
+            "CREATE INDEX IF NOT EXISTS members_user_conversation "
+            "ON members(user_id, conversation_id)",
+            # replies to a message
+            "CREATE INDEX IF NOT EXISTS messages_reply_id ON messages(reply_id)",
+            # contacts of a user are served by the contacts primary key
+        ],
+    ),
+    (
+        3,
+        "add message search index",
+        [
+            # Full text index of the message content. It is an external
+            # content table, the text is only stored in messages. The
+            # conversation id is indexed too, so a search can be limited to
+            # the user's conversations inside the MATCH
+            "CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5("
+            "content, conversation_id, content='messages', content_rowid='id', "
+            "tokenize='unicode61 remove_diacritics 2')",
+            # Keep the index in sync with messages
+            """
+            CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages
+            BEGIN
+                INSERT INTO messages_fts(rowid, content, conversation_id)
+                VALUES (new.id, new.content, new.conversation_id);
+            END
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages
+            BEGIN
+                INSERT INTO messages_fts(messages_fts, rowid, content, conversation_id)
+                VALUES ('delete', old.id, old.content, old.conversation_id);
+            END
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS messages_fts_update
+            AFTER UPDATE OF content, conversation_id ON messages
+            BEGIN
+                INSERT INTO messages_fts(messages_fts, rowid, content, conversation_id)
+                VALUES ('delete', old.id, old.content, old.conversation_id);
+                INSERT INTO messages_fts(rowid, content, conversation_id)
+                VALUES (new.id, new.content, new.conversation_id);
+            END
+            """,
+            # Index the existing messages
+            "INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')",
+        ],
+    ),
+    (
+        4,
+        "add conversation summaries and read state",
+        [
+            # Last message of every conversation, kept up to date by
+            # add_messages, so the conversation list needs no messages scan
+            "ALTER TABLE conversations ADD COLUMN last_message_id INTEGER",
+            "ALTER TABLE conversations ADD COLUMN last_message_preview TEXT",
+            "ALTER TABLE conversations ADD COLUMN last_message_at INTEGER",
+            # Highest message id read by every member
+            "ALTER TABLE members ADD COLUMN last_read_id INTEGER NOT NULL DEFAULT 0",
+            # Summaries of the existing conversations
+            """
+            UPDATE conversations SET last_message_id = (
+                SELECT MAX(id) FROM messages
+                WHERE messages.conversation_id = conversations.id
+            )
+            """,
+            """
+            UPDATE conversations SET
+                last_message_preview = (
+                    SELECT substr(content, 1, 100) FROM messages
+                    WHERE messages.id = conversations.last_message_id
+                ),
+                last_message_at = (
+                    SELECT sent_at FROM messages
+                    WHERE messages.id = conversations.last_message_id
+                )
+            WHERE last_message_id IS NOT NULL
+            """,
+            # Existing messages count as read, rather than everything unread
+            """
+            UPDATE members SET last_read_id = COALESCE((
+                SELECT last_message_id FROM conversations
+                WHERE conversations.id = members.conversation_id
+            ), 0)
+            """,
+        ],
+    ),
+]
+
+
+def get_version(db: sqlite3.Connection) -> int:
+    return db.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(db: sqlite3.Connection):
+    """
+    Apply all the pending migrations, each in its own transaction.
+
+    Returns a list of (version, description, elapsed seconds) for the
+    migrations that were applied.
+    """
+    timings = []
+    for version, description, statements in MIGRATIONS:
+        start = time.perf_counter()
+        cur = db.cursor()
+        # IMMEDIATE takes the write lock before user_version is checked, so
+        # two processes starting together don't apply the same migration
+        cur.execute("BEGIN IMMEDIATE")
+        try:
+            if get_version(db) >= version:
+                cur.execute("COMMIT")
+                continue
+            for statement in statements:
+                cur.execute(statement)
+            cur.execute(f"PRAGMA user_version = {version}")
+            cur.execute("COMMIT")
+        except sqlite3.Error as e:
+            cur.execute("ROLLBACK")
+            raise e
+        timings.append((version, description, time.perf_counter() - start))
+
+    return timings
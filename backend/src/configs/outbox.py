@@ -0,0 +1,152 @@
+import os
+import asyncio
+import collections
+
+from aiohttp import web
+
+import src.utils.metrics as metrics
+import src.utils.protocols as protocols
+
+OUTBOX_QUEUED = metrics.gauge(
+    "chatapp_outbox_queued_frames", "Frames waiting in the outbound queues"
+)
+OUTBOX_DEPTH = metrics.histogram(
+    "chatapp_outbox_depth",
+    "Depth of an outbound queue when a frame is added",
+    buckets=(0, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000),
+)
+OUTBOX_DROPS = metrics.counter(
+    "chatapp_outbox_drops_total",
+    "Frames dropped, or connections closed, because an outbound queue was full",
+    ("policy",),
+)
+
+# What to do when the outbound queue of a connection is full
+# - drop_oldest: drop the oldest queued frame
+# - coalesce: drop the presence updates that a newer update of the same user
+#   supersedes, and if that is not enough drop the oldest queued frame
+# - disconnect: close the connection, the client reconnects and refetches
+OUTBOX_POLICIES = ("drop_oldest", "coalesce", "disconnect")
+
+_UNKNOWN = object()  # presence key of a frame that wasn't parsed yet
+
+
+class Outbox:
+    """
+    Bounded outbound queue of a websocket, drained by its own writer task.
+
+    It has the send_json/close methods of the websocket, so it is used in its
+    place: sending only queues the frame and never waits for a slow client.
+    The frames are encoded in the wire format negotiated by the websocket.
+    """
+
+    def __init__(self, ws: web.WebSocketResponse, max_size: int, policy: str):
+        self.ws = ws
+        self.protocol = protocols.negotiated(ws.ws_protocol)
+        self.max_size = max_size
+        self.policy = policy
+        self.queue = collections.deque()  # [frame, presence key]
+        self.stopped = False
+        self._ready = asyncio.Event()
+        self._task = asyncio.create_task(self._write())
+
+    async def send_json(self, data):
+        self.put(protocols.encode(self.protocol, data))
+
+    async def send_frame(self, frame: protocols.Frame):
+        self.put(frame.encode(self.protocol))
+
+    def put(self, frame):
+        if self.stopped:
+            return
+
+        OUTBOX_DEPTH.observe(len(self.queue))
+        self.queue.append([frame, _UNKNOWN])
+        OUTBOX_QUEUED.inc()
+        if len(self.queue) > self.max_size:
+            self._overflow()
+        self._ready.set()
+
+    def _overflow(self):
+        OUTBOX_DROPS.inc(policy=self.policy)
+        if self.policy == "disconnect":
+            self.stop()
+            asyncio.create_task(self.ws.close(message="too slow, reconnect"))
+            return
+
+        if self.policy == "coalesce":
+            self._coalesce()
+        while len(self.queue) > self.max_size:
+            self.queue.popleft()
+            OUTBOX_QUEUED.dec()
+
+    def _coalesce(self):
+        # Keep only the latest presence update of every user
+        seen = set()
+        kept = collections.deque()
+        for entry in reversed(self.queue):
+            if entry[1] is _UNKNOWN:
+                entry[1] = _presence_key(entry[0])
+            if entry[1] is not None:
+                if entry[1] in seen:
+                    continue
+                seen.add(entry[1])
+            kept.appendleft(entry)
+        OUTBOX_QUEUED.dec(len(self.queue) - len(kept))
+        self.queue = kept
+
+    async def _write(self):
+        while True:
+            if len(self.queue) == 0:
+                self._ready.clear()
+                await self._ready.wait()
+                continue
+
+            frame = self.queue.popleft()[0]
+            OUTBOX_QUEUED.dec()
+            try:
+                if isinstance(frame, bytes):
+                    await self.ws.send_bytes(frame)
+                else:
+                    await self.ws.send_str(frame)
+            except ConnectionError:
+                self.stop()
+                return
+
+    def stop(self):
+        # Drop the queued frames, and stop the writer
+        self.stopped = True
+        self._task.cancel()
+        OUTBOX_QUEUED.dec(len(self.queue))
+        self.queue.clear()
+
+    async def close(self, **kwargs):
+        self.stop()
+        return await self.ws.close(**kwargs)
+
+
+def _presence_key(frame):
+    # Only called when a queue overflows, so the parsing cost doesn't matter
+    try:
+        data = protocols.decode(frame)
+    except ValueError:
+        return None
+    if data.get("type", None) != "user_status":
+        return None
+    return data["data"]["username"]
+
+
+OUTBOX_KEY = web.AppKey("outbox", dict)
+
+
+async def outbox_ctx(app: web.Application):
+    # Get the queue size and the slow consumer policy from environment
+    # variables, they are used for every new websocket
+    max_size = int(os.environ.get("OUTBOX_MAX_SIZE", "256"))
+    policy = os.environ.get("OUTBOX_POLICY", "drop_oldest")
+    if policy not in OUTBOX_POLICIES:
+        raise ValueError(f"unknown outbox policy '{policy}'")
+
+    app[OUTBOX_KEY] = {"max_size": max_size, "policy": policy}
+
+    yield
@@ -1,10 +1,128 @@
+import os
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import argon2
 from argon2 import PasswordHasher
 from aiohttp import web
 
-PASSHASHER_KEY = web.AppKey("passhasher", PasswordHasher)
+
+class HashUnavailable(Exception):
+    """Raised when the hashing service cannot take a job right now"""
+
+
+class HashQueueFull(HashUnavailable):
+    """Raised when too many hashing jobs are already waiting for a worker"""
+
+
+# Every worker process creates its own hasher, the parameters are the defaults
+# so hashes produced in the pool match hashes produced in the main process
+_worker_hasher = PasswordHasher()
+
+
+def _hash(password: str) -> str:
+    return _worker_hasher.hash(password)
+
+
+def _verify(passhash: str, password: str) -> bool:
+    try:
+        return _worker_hasher.verify(passhash, password)
+    except argon2.exceptions.VerificationError:
+        return False
+    except argon2.exceptions.InvalidHashError:
+        return False
+
+
+class PassHasherService:
+    """
+    Runs argon2 hashing and verification in a bounded process pool so that
+    the event loop is never blocked by the password hasher.
+
+    - workers: number of processes in the pool (concurrent jobs)
+    - max_queue: maximum number of jobs (running + waiting), after which new
+      jobs are rejected with HashQueueFull
+
+    If a worker process dies the pool is recreated, and the jobs that were
+    lost raise HashUnavailable.
+    """
+
+    def __init__(self, workers: int, max_queue: int):
+        self.hasher = PasswordHasher()
+        self.workers = workers
+        self.max_queue = max_queue
+        self.pending = 0  # Queue depth: running + waiting jobs
+        self.rejected = 0  # Number of jobs rejected because queue was full
+        self._pool = self._create_pool()
+
+    def _create_pool(self) -> ProcessPoolExecutor:
+        # forkserver: forking the app process directly is unsafe, as it can
+        # inherit locks held by the database threads
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("forkserver"),
+        )
+
+    def _job_done(self):
+        self.pending -= 1
+
+    async def _submit(self, fn, *args):
+        if self.pending >= self.max_queue:
+            self.rejected += 1
+            raise HashQueueFull()
+
+        loop = asyncio.get_running_loop()
+        pool = self._pool
+        try:
+            job = pool.submit(fn, *args)
+        except BrokenProcessPool:
+            self._restart_pool(pool)
+            raise HashUnavailable()
+
+        # The job is counted until the worker is done with it, even if the
+        # awaiting request gets cancelled in between
+        self.pending += 1
+        job.add_done_callback(lambda _: loop.call_soon_threadsafe(self._job_done))
+
+        try:
+            return await asyncio.wrap_future(job)
+        except BrokenProcessPool:
+            self._restart_pool(pool)
+            raise HashUnavailable()
+
+    def _restart_pool(self, broken: ProcessPoolExecutor):
+        # Only the first job that notices the broken pool replaces it
+        if self._pool is broken:
+            self._pool = self._create_pool()
+            broken.shutdown(wait=False, cancel_futures=True)
+
+    async def hash(self, password: str) -> str:
+        return await self._submit(_hash, password)
+
+    async def verify(self, passhash: str, password: str) -> bool:
+        return await self._submit(_verify, passhash, password)
+
+    def check_needs_rehash(self, passhash: str) -> bool:
+        # Only parses the hash parameters, cheap enough for the event loop
+        return self.hasher.check_needs_rehash(passhash)
+
+    def shutdown(self):
+        self._pool.shutdown(wait=True, cancel_futures=True)
+
+
+PASSHASHER_KEY = web.AppKey("passhasher", PassHasherService)
 
 
 async def passhasher_ctx(app: web.Application):
-    app[PASSHASHER_KEY] = PasswordHasher()
+    # Get the pool size and queue limit from environment variables
+    workers = int(os.environ.get("PASSHASHER_WORKERS", "2"))
+    max_queue = int(os.environ.get("PASSHASHER_MAX_QUEUE", "64"))
+
+    passhasher = PassHasherService(workers, max_queue)
+    app[PASSHASHER_KEY] = passhasher
 
     yield
+
+    # Stop all the hashing workers
+    passhasher.shutdown()
@@ -0,0 +1,157 @@
+import os
+import time
+import asyncio
+
+from aiohttp import web
+
+from src.configs.db import ADB_KEY, AsyncDB
+from src.configs.ws import WSS_KEY
+from src.configs.bus import BUS_KEY, BusClient
+import src.utils.utils as utils
+import src.utils.metrics as metrics
+
+PRESENCE_FLUSH_CHANGES = metrics.histogram(
+    "chatapp_presence_flush_changes",
+    "Number of status changes written to the users table per flush",
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000),
+)
+PRESENCE_RECONNECTS = metrics.counter(
+    "chatapp_presence_reconnects_total",
+    "Reconnects within the grace period, that changed nothing",
+)
+
+
+class Presence:
+    """
+    In-memory online status of the users connected to this worker.
+
+    handle_ws only reports the first connection and the last disconnection
+    of a user. The contacts hear about a user coming online right away, but
+    a user only goes offline after grace seconds without a connection, so a
+    quick reconnect (ex: a flapping mobile client) sends nothing at all.
+
+    The users table is updated every interval seconds, with all the status
+    changes since the last flush in one transaction.
+    """
+
+    def __init__(
+        self,
+        adb: AsyncDB,
+        wss: dict[str, set[web.WebSocketResponse]],
+        bus: BusClient,
+        interval: float,
+        grace: float,
+    ):
+        self.adb = adb
+        self.wss = wss
+        self.bus = bus
+        self.interval = interval
+        self.grace = grace
+        self.online: dict[str, int] = {}  # username -> user_id, announced
+        self.leaving: dict[str, tuple] = {}  # username -> (user_id, since)
+        self.writes: dict[int, tuple] = {}  # user_id -> (is_online, last_online)
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def connect(self, user_id: int, username: str):
+        if username in self.leaving:
+            # Back within the grace period, the contacts never knew
+            del self.leaving[username]
+            PRESENCE_RECONNECTS.inc()
+            return
+        if username in self.online:
+            return
+
+        self.online[username] = user_id
+        self.writes[user_id] = (True, int(time.time()))
+        await self._announce(user_id, username, True)
+
+    def disconnect(self, user_id: int, username: str):
+        self.leaving[username] = (user_id, time.time())
+
+    def is_online(self, username: str) -> bool:
+        # Users within the grace period are still online for their contacts
+        return self.bus.is_online(username) or username in self.leaving
+
+    async def _announce(self, user_id: int, username: str, is_online: bool):
+        await utils.send_data_contact(
+            self.wss,
+            user_id,
+            self.adb,
+            "user_status",
+            {"username": username, "is_online": is_online},
+            self.bus,
+        )
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                print("presence flush failed with exception %s" % e)
+
+    async def flush(self, force=False):
+        # The users past their grace period go offline, with force everyone
+        # still waiting does
+        now = time.time()
+        offline = []
+        for username, (user_id, since) in list(self.leaving.items()):
+            if not force and now - since < self.grace:
+                continue
+            del self.leaving[username]
+            self.online.pop(username, None)
+            # Reconnected to another worker, which keeps the user online
+            if not force and self.bus.is_remote(username):
+                continue
+            self.writes[user_id] = (False, int(since))
+            offline.append((user_id, username))
+
+        # Write all the changes at once, then tell the contacts
+        if len(self.writes) != 0:
+            writes, self.writes = self.writes, {}
+            PRESENCE_FLUSH_CHANGES.observe(len(writes))
+            error = await self.adb.write(
+                utils.set_users_status,
+                [(user_id, *status) for user_id, status in writes.items()],
+            )
+            if error is not None:
+                print(error)
+        for user_id, username in offline:
+            await self._announce(user_id, username, False)
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+        # The websockets are closed after this, so everyone goes offline now
+        now = time.time()
+        for username, user_id in self.online.items():
+            self.leaving.setdefault(username, (user_id, now))
+        await self.flush(force=True)
+
+
+PRESENCE_KEY = web.AppKey("presence", Presence)
+
+
+async def presence_ctx(app: web.Application):
+    # Get the flush interval and the offline grace period from environment
+    # variables
+    interval_ms = float(os.environ.get("PRESENCE_FLUSH_MS", "1000"))
+    grace_ms = float(os.environ.get("PRESENCE_GRACE_MS", "5000"))
+
+    presence = Presence(
+        app[ADB_KEY], app[WSS_KEY], app[BUS_KEY], interval_ms / 1000, grace_ms / 1000
+    )
+    presence.start()
+    app[PRESENCE_KEY] = presence
+
+    yield
+
+    await presence.close()
@@ -1,16 +1,19 @@
 from aiohttp import web
 
+from src.configs.outbox import Outbox
+
 WSS_KEY = web.AppKey(
-    "wss", dict[str, web.WebSocketResponse]
-)  # map of all the users and there websocket
+    "wss", dict[str, set[Outbox]]
+)  # map of all the connected users and there websockets, one per device
 
 
 async def wss_ctx(app: web.Application):
-    # Add the dictionary to store websocket per username
+    # Add the dictionary to store websockets per username
     app[WSS_KEY] = dict()
 
     yield
 
-    # Remove all the websocket
-    for username, ws in app[WSS_KEY].items():
-        await ws.close()
+    # Remove all the websocket, closing removes them from the dictionary
+    for username, connections in list(app[WSS_KEY].items()):
+        for ws in list(connections):
+            await ws.close()
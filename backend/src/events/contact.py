@@ -1,11 +1,12 @@
 from aiohttp import web
 
 import src.utils.utils as utils
-from src.configs.ws import WSS_KEY
-from src.configs.db import DB_KEY
+from src.utils.session import Session
+from src.configs.db import ADB_KEY
+from src.configs.presence import PRESENCE_KEY
 
 
-async def handle_add_contact(app: web.Application, username: str, event: dict):
+async def handle_add_contact(app: web.Application, session: Session, event: dict):
     """
     request schema:
         {
@@ -36,16 +37,10 @@ async def handle_add_contact(app: web.Application, username: str, event: dict):
                 }
             }
     """
-    db = app[DB_KEY]
-    wss = app[WSS_KEY]
-    ws = wss[username]  # Get current username's websocket
-
-    # Get userinfo
-    user = utils.get_user_info(db, username)
-    if user is None:
-        return await utils.send_error(
-            ws, event["type"], f"no such user '{username}' exists"
-        )
+    adb = app[ADB_KEY]
+    presence = app[PRESENCE_KEY]
+    ws = session.ws
+    username = session.username
 
     # Get contact username
     contact_username = event.get("contact_username", None)
@@ -57,20 +52,20 @@ async def handle_add_contact(app: web.Application, username: str, event: dict):
         return await utils.send_error(
             ws, event["type"], f"cannot add itself as a contact"
         )
-    contact_user = utils.get_user_info(db, contact_username)
+    contact_user = await adb.read(utils.get_user_info, contact_username)
     if contact_user is None:
         return await utils.send_error(
             ws, event["type"], f"no such user '{contact_username}' exists"
         )
 
     # Check if contact_username is already a contact
-    if utils.is_contact(db, user[0], contact_user[0]):
+    if await adb.read(utils.is_contact, session.user_id, contact_user[0]):
         return await utils.send_error(
             ws, event["type"], f"'{contact_username}' is already a contact"
         )
 
     # Add contact_username as a contact
-    utils.add_contact(db, user[0], contact_user[0])
+    await adb.write(utils.add_contact, session.user_id, contact_user[0])
     await utils.send_data(
         ws,
         event["type"],
@@ -79,7 +74,7 @@ async def handle_add_contact(app: web.Application, username: str, event: dict):
             "contact": {
                 "username": contact_user[1],
                 "fullname": contact_user[2],
-                "is_online": contact_user[4],
+                "is_online": presence.is_online(contact_username),
                 "last_online": contact_user[5],
                 "created_at": contact_user[6],
             },
@@ -87,7 +82,7 @@ async def handle_add_contact(app: web.Application, username: str, event: dict):
     )
 
 
-async def handle_get_contacts(app: web.Application, username: str, event: dict):
+async def handle_get_contacts(app: web.Application, session: Session, event: dict):
     """
     request schema:
         {
@@ -122,31 +117,23 @@ async def handle_get_contacts(app: web.Application, username: str, event: dict):
                 }
             }
     """
-    db = app[DB_KEY]
-    wss = app[WSS_KEY]
-    ws = wss[username]  # Get current username's websocket
-
-    # Get userinfo
-    user = utils.get_user_info(db, username)
-    if user is None:
-        return await utils.send_error(
-            ws, event["type"], f"no such user '{username}' exists"
-        )
+    adb = app[ADB_KEY]
+    presence = app[PRESENCE_KEY]
+    ws = session.ws
 
-    # Get all the contacts
-    contacts = utils.get_contacts(db, user[0])
-    res = []
-    for contact_username in contacts:
-        contact_user = utils.get_user_info(db, contact_username)
-        res.append(
-            {
-                "username": contact_user[1],
-                "fullname": contact_user[2],
-                "is_online": contact_user[4],
-                "last_online": contact_user[5],
-                "created_at": contact_user[6],
-            }
-        )
+    # Get all the contacts, is_online comes from the connected websockets of
+    # every worker and the users within their offline grace period
+    contacts = await adb.read(utils.get_contacts_info, session.user_id)
+    res = [
+        {
+            "username": contact_username,
+            "fullname": fullname,
+            "is_online": presence.is_online(contact_username),
+            "last_online": last_online,
+            "created_at": created_at,
+        }
+        for contact_username, fullname, last_online, created_at in contacts
+    ]
 
     await utils.send_data(
         ws, event["type"], {"message": "got all the contacts", "contacts": res}
@@ -1,11 +1,16 @@
 from aiohttp import web
 
 import src.utils.utils as utils
+from src.utils.session import Session
 from src.configs.ws import WSS_KEY
-from src.configs.db import DB_KEY
+from src.configs.db import ADB_KEY
+from src.configs.members import MEMBERS_KEY
+from src.configs.bus import BUS_KEY
 
 
-async def handle_create_conversation(app: web.Application, username: str, event: dict):
+async def handle_create_conversation(
+    app: web.Application, session: Session, event: dict
+):
     """
     request schema:
         {
@@ -41,9 +46,12 @@ async def handle_create_conversation(app: web.Application, username: str, event:
                 }
             }
     """
-    db = app[DB_KEY]
+    adb = app[ADB_KEY]
+    members_cache = app[MEMBERS_KEY]
     wss = app[WSS_KEY]
-    ws = wss[username]  # Get current username's websocket
+    bus = app[BUS_KEY]
+    ws = session.ws
+    username = session.username
 
     # Check if members are valid member type
     name = event.get("name", None)
@@ -67,26 +75,35 @@ async def handle_create_conversation(app: web.Application, username: str, event:
 
     # Check if members are valid username
     for m in members:
-        m_user = utils.get_user_info(db, m)
+        m_user = await adb.read(utils.get_user_info, m)
         if m_user is None:
             return await utils.send_error(
                 ws, event["type"], f"'{m}' is not a valid username"
             )
 
     # Create a new conversation
-    id = utils.create_conversation(db, name, members)
+    id = await adb.write(utils.create_conversation, name, members)
     if id is None:
         return await utils.send_error(
             ws, event["type"], f"something went wrong: utils.create_conversation"
         )
 
+    # Keep the membership cache of every worker up to date
+    members_cache.add_conversation(id, members)
+    bus.publish("add_conversation", id=id, members=members)
+
     # Send to all the active members
     await utils.send_data_convo(
-        id, wss, db, event["type"], {"id": id, "name": name, "members": members}
+        id,
+        wss,
+        members_cache,
+        event["type"],
+        {"id": id, "name": name, "members": members},
+        bus,
     )
 
 
-async def handle_get_conversations(app: web.Application, username: str, event: dict):
+async def handle_get_conversations(app: web.Application, session: Session, event: dict):
     """
     request schema:
         {
@@ -101,14 +118,22 @@ async def handle_get_conversations(app: web.Application, username: str, event: d
                 "error": "..." # Error message
             }
 
-        success schema:
+        success schema: The most recently active conversation first,
+        conversations without messages last
             {
                 "type": "get_conversations",
                 "success": true,
                 "data": [
                     { // This is the first conversation; no members included
                         "id": 123,
-                        "name": "..."
+                        "name": "...",
+                        "last_message": {       // null without messages
+                            "id": 456,          // Message id
+                            "preview": "...",   // First 100 characters of the content
+                            "sent_at": 123      // Time when message was sent
+                        },
+                        "last_read_id": 450,    // Highest message id read
+                        "unread_count": 6       // Messages after last_read_id, max 1000
                     },
                     { // This is the second conversation
                         ...
@@ -117,18 +142,17 @@ async def handle_get_conversations(app: web.Application, username: str, event: d
                 ]
             }
     """
-    db = app[DB_KEY]
-    wss = app[WSS_KEY]
-    ws = wss[username]  # Get current username's websocket
+    adb = app[ADB_KEY]
+    ws = session.ws
 
     # Get all the conversations
-    res = utils.get_conversations(db, username)
+    res = await adb.read(utils.get_conversations, session.user_id)
 
     await utils.send_data(ws, event["type"], res)
 
 
 async def handle_get_conversation_info(
-    app: web.Application, username: str, event: dict
+    app: web.Application, session: Session, event: dict
 ):
     """
     request schema:
@@ -160,9 +184,10 @@ async def handle_get_conversation_info(
                 }
             }
     """
-    db = app[DB_KEY]
-    wss = app[WSS_KEY]
-    ws = wss[username]  # Get current username's websocket
+    adb = app[ADB_KEY]
+    members_cache = app[MEMBERS_KEY]
+    ws = session.ws
+    username = session.username
 
     # Get conversation id
     convo_id = event.get("id", None)
@@ -170,13 +195,95 @@ async def handle_get_conversation_info(
         return await utils.send_error(ws, event["type"], "id is required as int")
 
     # Check if username is part of the conversation
-    if not utils.has_conversation(db, username, convo_id):
+    if not await members_cache.is_member(username, convo_id):
         return await utils.send_error(
             ws,
             event["type"],
             f"{username} is not part of any conversation with {convo_id} id",
         )
 
-    # Get conversation information
-    res = utils.get_conversation_info(db, convo_id)
-    await utils.send_data(ws, event["type"], res)
+    # Get conversation information, members come from the membership cache
+    name = await adb.read(utils.get_conversation_name, convo_id)
+    members = await members_cache.get_members(convo_id)
+    await utils.send_data(
+        ws, event["type"], {"id": convo_id, "name": name, "members": list(members)}
+    )
+
+
+async def handle_mark_read(app: web.Application, session: Session, event: dict):
+    """
+    request schema:
+        {
+            "type": "mark_read",
+            "conversation_id": 123, // Conversation id
+            "message_id": 456       // Last message read, inside the conversation
+        }
+
+    response schema:
+        error schema: This is only send to the request websocket
+            {
+                "type": "mark_read",
+                "success": false,
+                "error": "..." # Error message
+            }
+
+        success schema: This is send to all the websockets of the user, so
+        every device can update its unread counts
+            {
+                "type": "mark_read",
+                "success": true,
+                "data": {
+                    "conversation_id": 123,
+                    "last_read_id": 456     // Read position, it never moves back
+                }
+            }
+    """
+    adb = app[ADB_KEY]
+    members_cache = app[MEMBERS_KEY]
+    wss = app[WSS_KEY]
+    bus = app[BUS_KEY]
+    ws = session.ws
+    username = session.username
+
+    # Check if conversation_id is valid
+    conversation_id = event.get("conversation_id", None)
+    if type(conversation_id) is not int:
+        return await utils.send_error(
+            ws, event["type"], "expected conversation_id as integer"
+        )
+    if not await members_cache.is_member(username, conversation_id):
+        return await utils.send_error(
+            ws,
+            event["type"],
+            f"{username} not part of conversation with {conversation_id} id",
+        )
+
+    # Check if the message is part of the conversation
+    message_id = event.get("message_id", None)
+    if type(message_id) is not int:
+        return await utils.send_error(
+            ws, event["type"], "expected message_id as integer"
+        )
+    if not await adb.read(utils.has_message, conversation_id, message_id):
+        return await utils.send_error(
+            ws,
+            event["type"],
+            f"No such {message_id} message id found in {conversation_id} conversation_id",
+        )
+
+    last_read_id = await adb.write(
+        utils.mark_read, session.user_id, conversation_id, message_id
+    )
+    if last_read_id is None:
+        return await utils.send_error(
+            ws, event["type"], "something went wrong: mark_read"
+        )
+
+    # Send to all the devices of the user
+    await utils.send_data_users(
+        wss,
+        bus,
+        [username],
+        event["type"],
+        {"conversation_id": conversation_id, "last_read_id": last_read_id},
+    )
@@ -2,11 +2,21 @@ import time
 from aiohttp import web
 
 import src.utils.utils as utils
+from src.utils.session import Session
 from src.configs.ws import WSS_KEY
-from src.configs.db import DB_KEY
+from src.configs.db import ADB_KEY
+from src.configs.batcher import BATCHER_KEY
+from src.configs.members import MEMBERS_KEY
+from src.configs.bus import BUS_KEY
 
+MESSAGES_LIMIT = 100  # default page size of get_messages
+MESSAGES_MAX_LIMIT = 500  # larger pages are capped to this
+SEARCH_LIMIT = 20  # default page size of search_messages
+SEARCH_MAX_LIMIT = 100  # larger pages are capped to this
+SEARCH_MAX_OFFSET = 1000  # ranking deeper than this is not worth it
 
-async def handle_send_message(app: web.Application, username: str, event: dict):
+
+async def handle_send_message(app: web.Application, session: Session, event: dict):
     """
     request schema:
         {
@@ -38,9 +48,12 @@ async def handle_send_message(app: web.Application, username: str, event: dict):
                 }
             }
     """
-    db = app[DB_KEY]
+    adb = app[ADB_KEY]
+    batcher = app[BATCHER_KEY]
+    members_cache = app[MEMBERS_KEY]
     wss = app[WSS_KEY]
-    ws = wss[username]  # Get current username's websocket
+    ws = session.ws
+    username = session.username
 
     # Check if conversation_id is valid
     conversation_id = event.get("conversation_id", None)
@@ -48,7 +61,7 @@ async def handle_send_message(app: web.Application, username: str, event: dict):
         return await utils.send_error(
             ws, event["type"], "expected conversation_id as integer"
         )
-    if not utils.has_conversation(db, username, conversation_id):
+    if not await members_cache.is_member(username, conversation_id):
         return await utils.send_error(
             ws,
             event["type"],
@@ -70,26 +83,34 @@ async def handle_send_message(app: web.Application, username: str, event: dict):
         return await utils.send_error(
             ws, event["type"], "if reply_id is provided then expected integer"
         )
-    if reply_id is not None and not utils.has_message(db, conversation_id, reply_id):
+    if reply_id is not None and not await adb.read(
+        utils.has_message, conversation_id, reply_id
+    ):
         return await utils.send_error(
             ws,
             event["type"],
             f"No such {reply_id} message id found in {conversation_id} conversation_id",
         )
 
-    # Insert message in database
+    # Insert message in database, possibly batched with other senders
     sent_at = int(time.time())
-    id = utils.add_message(db, conversation_id, content, reply_id, username, sent_at)
+    id = await batcher.add_message(
+        conversation_id,
+        content,
+        reply_id,
+        session.user_id,
+        sent_at,
+    )
     if id is None:
         return await utils.send_error(
-            ws, event["type"], "something went wrong: utils.add_message"
+            ws, event["type"], "something went wrong: add_message"
         )
 
     # send the message to all the members in the conversation
     await utils.send_data_convo(
         conversation_id,
         wss,
-        db,
+        members_cache,
         event["type"],
         {
             "id": id,
@@ -99,16 +120,19 @@ async def handle_send_message(app: web.Application, username: str, event: dict):
             "content": content,
             "sent_at": sent_at,
         },
+        app[BUS_KEY],
     )
 
 
-async def handle_get_messages(app: web.Application, username: str, event: dict):
+async def handle_get_messages(app: web.Application, session: Session, event: dict):
     """
     request schema:
         {
             "type": "get_messages",
             "conversation_id": 123, // Conversation id
-            "before": 123,          // optional: All messages before the given message id
+            "before": 123,          // optional: Only messages before the given message id
+            "after": 123,           // optional: Only messages after the given message id
+            "limit": 100            // optional: Number of messages, default 100, max 500
         }
 
     response schema:
@@ -119,13 +143,15 @@ async def handle_get_messages(app: web.Application, username: str, event: dict):
                 "error": "..." # Error message
             }
 
-        success schema: sends the most recent messages(In descending order)
+        success schema: sends the most recent messages(In descending order). If
+        after is given, sends the oldest messages after it(In ascending order)
             {
                 "type": "get_messages",
                 "success": true,
                 "data": {
                     "conversation_id": 123, // conversation_id
-                    "messages": [           // List of messages, max 100
+                    "has_more": true,       // There are more messages past this page
+                    "messages": [           // List of messages, max limit
                         {
                             "id": 123,                // Message id
                             "sender_username": "...", // Senders username
@@ -138,9 +164,10 @@ async def handle_get_messages(app: web.Application, username: str, event: dict):
                 }
             }
     """
-    db = app[DB_KEY]
-    wss = app[WSS_KEY]
-    ws = wss[username]  # Get current username's websocket
+    adb = app[ADB_KEY]
+    members_cache = app[MEMBERS_KEY]
+    ws = session.ws
+    username = session.username
 
     # Check if conversation_id is valid
     conversation_id = event.get("conversation_id", None)
@@ -148,21 +175,141 @@ async def handle_get_messages(app: web.Application, username: str, event: dict):
         return await utils.send_error(
             ws, event["type"], "expected conversation_id as integer"
         )
-    if not utils.has_conversation(db, username, conversation_id):
+    if not await members_cache.is_member(username, conversation_id):
         return await utils.send_error(
             ws,
             event["type"],
             f"{username} not part of conversation with {conversation_id} id",
         )
 
-    # Check if before is valid
-    before = event.get(
-        "before", 1 << 55
-    )  # Assuming 2**55 is the max messages in the db
-    if type(before) is not int:
+    # Check if before and after are valid
+    before = event.get("before", None)
+    if before is not None and type(before) is not int:
         return await utils.send_error(ws, event["type"], "expected before as integer")
+    after = event.get("after", None)
+    if after is not None and type(after) is not int:
+        return await utils.send_error(ws, event["type"], "expected after as integer")
+
+    # Check if limit is valid, large pages are capped
+    limit = event.get("limit", MESSAGES_LIMIT)
+    if type(limit) is not int or limit <= 0:
+        return await utils.send_error(
+            ws, event["type"], "expected limit as positive integer"
+        )
+    limit = min(limit, MESSAGES_MAX_LIMIT)
+
+    messages, has_more = await adb.read(
+        utils.get_messages, conversation_id, before, after, limit
+    )
+    await utils.send_data(
+        ws,
+        event["type"],
+        {
+            "conversation_id": conversation_id,
+            "has_more": has_more,
+            "messages": messages,
+        },
+    )
+
+
+async def handle_search_messages(app: web.Application, session: Session, event: dict):
+    """
+    request schema:
+        {
+            "type": "search_messages",
+            "query": "...",         // Words to search, all of them must match
+            "conversation_id": 123, // optional: Only search in this conversation
+            "offset": 0,            // optional: Number of results to skip, max 1000
+            "limit": 20             // optional: Number of results, default 20, max 100
+        }
+
+    response schema:
+        error schema:
+            {
+                "type": "search_messages",
+                "success": false,
+                "error": "..." # Error message
+            }
+
+        success schema: messages of the user's conversations, best match first
+            {
+                "type": "search_messages",
+                "success": true,
+                "data": {
+                    "query": "...",         // The searched query
+                    "has_more": true,       // There are more results past this page
+                    "next_offset": 20,      // offset of the next page
+                    "messages": [           // List of messages, max limit
+                        {
+                            "id": 123,                // Message id
+                            "conversation_id": 123,   // Conversation id
+                            "sender_username": "...", // Senders username
+                            "reply_id": 123,          // Message id
+                            "content": "...",         // Message content
+                            "sent_at": 123,           // timestamp of when data was sent
+                        },
+                        ...
+                    ]
+                }
+            }
+    """
+    adb = app[ADB_KEY]
+    members_cache = app[MEMBERS_KEY]
+    ws = session.ws
+    username = session.username
+
+    # Check if query is valid
+    query = event.get("query", None)
+    if type(query) is not str or len(query.split()) == 0:
+        return await utils.send_error(
+            ws, event["type"], "expected query as non empty string"
+        )
 
-    messages = utils.get_messages(db, conversation_id, before)
+    # Check if conversation_id is valid
+    conversation_id = event.get("conversation_id", None)
+    if conversation_id is not None:
+        if type(conversation_id) is not int:
+            return await utils.send_error(
+                ws, event["type"], "expected conversation_id as integer"
+            )
+        if not await members_cache.is_member(username, conversation_id):
+            return await utils.send_error(
+                ws,
+                event["type"],
+                f"{username} not part of conversation with {conversation_id} id",
+            )
+
+    # Check if offset and limit are valid, large pages are capped
+    offset = event.get("offset", 0)
+    if type(offset) is not int or offset < 0 or offset > SEARCH_MAX_OFFSET:
+        return await utils.send_error(
+            ws,
+            event["type"],
+            f"expected offset as integer between 0 and {SEARCH_MAX_OFFSET}",
+        )
+    limit = event.get("limit", SEARCH_LIMIT)
+    if type(limit) is not int or limit <= 0:
+        return await utils.send_error(
+            ws, event["type"], "expected limit as positive integer"
+        )
+    limit = min(limit, SEARCH_MAX_LIMIT)
+
+    # Search in the given conversation, or in all the user's conversations
+    if conversation_id is not None:
+        conversation_ids = [conversation_id]
+    else:
+        conversation_ids = sorted(await members_cache.get_conversations(username))
+
+    messages, has_more = await adb.read(
+        utils.search_messages, session.user_id, query, conversation_ids, offset, limit
+    )
     await utils.send_data(
-        ws, event["type"], {"conversation_id": conversation_id, "messages": messages}
+        ws,
+        event["type"],
+        {
+            "query": query,
+            "has_more": has_more,
+            "next_offset": offset + len(messages),
+            "messages": messages,
+        },
     )
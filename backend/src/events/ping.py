@@ -1,17 +1,16 @@
 from aiohttp import web
 
 import src.utils.utils as utils
-from src.configs.ws import WSS_KEY
+from src.utils.session import Session
 
 
-async def handle_ping(app: web.Application, username: str, event: dict):
+async def handle_ping(app: web.Application, session: Session, event: dict):
     """
     request schema:
         {
             "type": "ping"
         }
     """
-    wss = app[WSS_KEY]
-    ws = wss[username]  # Get current username's websocket
+    ws = session.ws
 
     await utils.send_data(ws, event["type"], "pong")
@@ -1,11 +1,12 @@
 from aiohttp import web
 
 import src.utils.utils as utils
-from src.configs.ws import WSS_KEY
-from src.configs.db import DB_KEY
+from src.utils.session import Session
+from src.configs.db import ADB_KEY
+from src.configs.presence import PRESENCE_KEY
 
 
-async def handle_self(app: web.Application, username: str, event: dict):
+async def handle_self(app: web.Application, session: Session, event: dict):
     """
     request schema:
         {
@@ -33,26 +34,28 @@ async def handle_self(app: web.Application, username: str, event: dict):
                 }
             }
     """
-    db = app[DB_KEY]
-    wss = app[WSS_KEY]
-    ws = wss[username]  # Get current username's websocket
+    adb = app[ADB_KEY]
+    presence = app[PRESENCE_KEY]
+    ws = session.ws
+    username = session.username
 
     # Get userinfo
-    row = utils.get_user_info(db, username)
+    row = await adb.read(utils.get_user_info, username)
     if row is None:
         return await utils.send_error(
             ws, event["type"], f"no such user '{username}' exists"
         )
 
-    # Send userinfo
-    _, username, fullname, _, is_online, last_online, created_at = row
+    # Send userinfo, the users table only gets the online status with the
+    # next presence flush
+    _, username, fullname, _, _, last_online, created_at = row
     return await utils.send_data(
         ws,
         event["type"],
         {
             "username": username,
             "fullname": fullname,
-            "is_online": bool(is_online),
+            "is_online": presence.is_online(username),
             "last_online": last_online,
             "created_at": created_at,
         },
@@ -0,0 +1,99 @@
+from aiohttp import web
+
+import src.utils.utils as utils
+from src.utils.session import Session
+from src.configs.db import ADB_KEY
+
+SYNC_LIMIT = 100  # default page size of sync
+SYNC_MAX_LIMIT = 500  # larger pages are capped to this
+
+
+async def handle_sync(app: web.Application, session: Session, event: dict):
+    """
+    request schema:
+        {
+            "type": "sync",
+            "after": 123,               // optional: Highest message id seen, default 0
+            "conversations_after": 12,  // optional: Highest conversation id seen, default 0
+            "limit": 100                // optional: Page size, default 100, max 500
+        }
+
+    response schema:
+        error schema:
+            {
+                "type": "sync",
+                "success": false,
+                "error": "..." # Error message
+            }
+
+        success schema: everything new since the cursors, in ascending id order.
+        Send the returned cursors back while has_more is true.
+            {
+                "type": "sync",
+                "success": true,
+                "data": {
+                    "after": 456,               // Next message cursor
+                    "conversations_after": 15,  // Next conversation cursor
+                    "has_more": false,          // There is another page
+                    "conversations": [          // New conversations, max limit
+                        {
+                            "id": 13,
+                            "name": "...",
+                            "members": ["user1", "user2", ...]
+                        },
+                        ...
+                    ],
+                    "messages": [               // New messages of all conversations, max limit
+                        {
+                            "id": 124,
+                            "conversation_id": 13,
+                            "sender_username": "...",
+                            "reply_id": 123,
+                            "content": "...",
+                            "sent_at": 123
+                        },
+                        ...
+                    ]
+                }
+            }
+    """
+    adb = app[ADB_KEY]
+    ws = session.ws
+
+    # Check if the cursors are valid
+    after = event.get("after", 0)
+    if type(after) is not int:
+        return await utils.send_error(ws, event["type"], "expected after as integer")
+    conversations_after = event.get("conversations_after", 0)
+    if type(conversations_after) is not int:
+        return await utils.send_error(
+            ws, event["type"], "expected conversations_after as integer"
+        )
+
+    # Check if limit is valid, large pages are capped
+    limit = event.get("limit", SYNC_LIMIT)
+    if type(limit) is not int or limit <= 0:
+        return await utils.send_error(
+            ws, event["type"], "expected limit as positive integer"
+        )
+    limit = min(limit, SYNC_MAX_LIMIT)
+
+    conversations, messages, has_more = await adb.read(
+        utils.get_sync, session.user_id, after, conversations_after, limit
+    )
+    if len(messages) > 0:
+        after = messages[-1]["id"]
+    if len(conversations) > 0:
+        conversations_after = conversations[-1]["id"]
+
+    await utils.send_data(
+        ws,
+        event["type"],
+        {
+            "after": after,
+            "conversations_after": conversations_after,
+            "has_more": has_more,
+            "conversations": conversations,
+            "messages": messages,
+        },
+    )
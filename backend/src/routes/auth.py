@@ -3,12 +3,12 @@ import time
 import sqlite3
 
 import jwt
-import argon2
 from aiohttp import web
 
-from src.configs.db import DB_KEY
-from src.configs.passhasher import PASSHASHER_KEY
-from src.configs.jwt import JWT_KEY
+import src.utils.codec as codec
+from src.configs.db import ADB_KEY
+from src.configs.passhasher import PASSHASHER_KEY, HashUnavailable
+from src.configs.jwt import JWT_KEY, TOKEN_CACHE_KEY
 
 
 def update_password_hash(db: sqlite3.Connection, username: str, password: str) -> str:
@@ -26,14 +26,19 @@ def update_password_hash(db: sqlite3.Connection, username: str, password: str) -
     return None
 
 
+def get_password_hashes(db: sqlite3.Connection, username: str):
+    cur = db.execute("SELECT password FROM users WHERE username = ?", [username])
+    return cur.fetchall()
+
+
 async def handle_login(request: web.Request):
-    db = request.app[DB_KEY]
+    adb = request.app[ADB_KEY]
     passhasher = request.app[PASSHASHER_KEY]
     jwtsecret = request.app[JWT_KEY]
 
     # Check if payload is a valid json
     try:
-        payload = await request.json()
+        payload = await request.json(loads=codec.loads)
     except json.JSONDecodeError:
         raise web.HTTPBadRequest(text="not a valid json")
 
@@ -61,22 +66,23 @@ async def handle_login(request: web.Request):
 
     # Check if password is correct
     valid_pass = False
-    cur = db.execute("SELECT password FROM users WHERE username = ?", [username])
-    password_hashes = cur.fetchall()
+    password_hashes = await adb.read(get_password_hashes, username)
     if len(password_hashes) == 1:
         passhash = password_hashes[0][0]
         try:
-            passhasher.verify(passhash, password)
-            valid_pass = True
-        except argon2.exceptions.VerificationError:
-            pass
+            valid_pass = await passhasher.verify(passhash, password)
+        except HashUnavailable:
+            raise web.HTTPServiceUnavailable(text="server busy, try again later")
     if not valid_pass:
         raise web.HTTPUnauthorized(text="mismatch username and password")
 
     # Check if password needs rehash for security reasons
     if passhasher.check_needs_rehash(passhash):
-        new_passhash = passhasher.hash(password)
-        err = update_password_hash(db, username, new_passhash)
+        try:
+            new_passhash = await passhasher.hash(password)
+        except HashUnavailable:
+            raise web.HTTPServiceUnavailable(text="server busy, try again later")
+        err = await adb.write(update_password_hash, username, new_passhash)
         if err is not None:
             raise web.HTTPServerError(text=err)
 
@@ -94,7 +100,7 @@ async def handle_login(request: web.Request):
 
 
 async def handle_verify(request: web.Request):
-    jwtsecret = request.app[JWT_KEY]
+    token_cache = request.app[TOKEN_CACHE_KEY]
 
     # Check if the request has a valid login-token cookie
     login_token = request.cookies.get("login-token", None)
@@ -102,7 +108,7 @@ async def handle_verify(request: web.Request):
         raise web.HTTPUnauthorized(text="login-token required")
 
     try:
-        decoded_jwt = jwt.decode(login_token, jwtsecret, algorithms="HS256")
+        decoded_jwt = token_cache.decode(login_token)
         username = decoded_jwt["username"]
     except jwt.exceptions.InvalidTokenError:
         raise web.HTTPUnauthorized(text="invalid login-token")
@@ -0,0 +1,28 @@
+from aiohttp import web
+
+import src.utils.metrics as metrics
+from src.configs.passhasher import PASSHASHER_KEY
+from src.configs.ws import WSS_KEY
+
+ACTIVE_WEBSOCKETS = metrics.gauge(
+    "chatapp_active_websockets", "Number of connected websockets"
+)
+PASSHASHER_QUEUE = metrics.gauge(
+    "chatapp_passhasher_queue_depth", "Hashing jobs running or waiting for a worker"
+)
+PASSHASHER_REJECTED = metrics.gauge(
+    "chatapp_passhasher_rejected", "Hashing jobs rejected because the queue was full"
+)
+
+
+async def handle_metrics(request: web.Request):
+    # Values that live on the app are read at scrape time
+    wss = request.app[WSS_KEY]
+    ACTIVE_WEBSOCKETS.set(sum(len(connections) for connections in wss.values()))
+    passhasher = request.app[PASSHASHER_KEY]
+    PASSHASHER_QUEUE.set(passhasher.pending)
+    PASSHASHER_REJECTED.set(passhasher.rejected)
+
+    return web.Response(
+        text=metrics.render(), content_type="text/plain", charset="utf-8"
+    )
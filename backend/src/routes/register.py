@@ -3,8 +3,9 @@ import sqlite3
 
 from aiohttp import web
 
-from src.configs.db import DB_KEY
-from src.configs.passhasher import PASSHASHER_KEY
+import src.utils.codec as codec
+from src.configs.db import ADB_KEY
+from src.configs.passhasher import PASSHASHER_KEY, HashUnavailable
 
 
 def insert_user(
@@ -24,13 +25,18 @@ def insert_user(
     return None
 
 
+def username_exists(db: sqlite3.Connection, username: str) -> bool:
+    cur = db.execute("SELECT COUNT(*) FROM users WHERE username = ?", [username])
+    return cur.fetchone()[0] != 0
+
+
 async def handle_register(request: web.Request):
-    db = request.app[DB_KEY]
+    adb = request.app[ADB_KEY]
     passhaser = request.app[PASSHASHER_KEY]
 
     # Check if payload is a valid json
     try:
-        payload = await request.json()
+        payload = await request.json(loads=codec.loads)
     except json.JSONDecodeError:
         raise web.HTTPBadRequest(text="not a valid json")
 
@@ -64,17 +70,18 @@ async def handle_register(request: web.Request):
         raise web.HTTPBadRequest(text="fullname should not be empty")
 
     # Check if username already exists
-    exists = False
-    cur = db.execute("SELECT COUNT(*) FROM users WHERE username = ?", [username])
-    exists = cur.fetchone()[0] != 0
+    exists = await adb.read(username_exists, username)
     if exists:
         raise web.HTTPConflict(text="username already exists")
 
     # Convert the password to an encryted hash
-    password_hash = passhaser.hash(password)
+    try:
+        password_hash = await passhaser.hash(password)
+    except HashUnavailable:
+        raise web.HTTPServiceUnavailable(text="server busy, try again later")
 
     # Insert username, password, and fullname into the database
-    err = insert_user(db, username, password_hash, fullname)
+    err = await adb.write(insert_user, username, password_hash, fullname)
     if err is not None:
         raise web.HTTPServerError(text=err)
 
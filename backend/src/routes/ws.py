@@ -1,13 +1,19 @@
-import json
+import time
 
 import jwt
 import aiohttp
 from aiohttp import web
 
-from src.configs.jwt import JWT_KEY
-from src.configs.db import DB_KEY
+from src.configs.jwt import TOKEN_CACHE_KEY
+from src.configs.db import ADB_KEY
 from src.configs.ws import WSS_KEY
+from src.configs.outbox import OUTBOX_KEY, Outbox
+from src.configs.bus import BUS_KEY
+from src.configs.presence import PRESENCE_KEY
 import src.utils.utils as utils
+import src.utils.metrics as metrics
+import src.utils.protocols as protocols
+from src.utils.session import Session
 from src.events.ping import handle_ping
 from src.events.self import handle_self
 from src.events.contact import handle_add_contact, handle_get_contacts
@@ -15,43 +21,172 @@ from src.events.conversation import (
     handle_create_conversation,
     handle_get_conversations,
     handle_get_conversation_info,
+    handle_mark_read,
 )
-from src.events.message import handle_send_message, handle_get_messages
+from src.events.message import (
+    handle_send_message,
+    handle_get_messages,
+    handle_search_messages,
+)
+from src.events.sync import handle_sync
+
 
+# Event type -> handler. Every handler is called as handler(app, session, event)
+EVENT_HANDLERS = {
+    "ping": handle_ping,
+    "self": handle_self,
+    "add_contact": handle_add_contact,
+    "get_contacts": handle_get_contacts,
+    "create_conversation": handle_create_conversation,
+    "get_conversations": handle_get_conversations,
+    "get_conversation_info": handle_get_conversation_info,
+    "mark_read": handle_mark_read,
+    "send_message": handle_send_message,
+    "get_messages": handle_get_messages,
+    "search_messages": handle_search_messages,
+    "sync": handle_sync,
+}
 
-async def handle_ws_event(app: web.Application, username: str, event: dict):
-    ws = app[WSS_KEY][username]
+EVENTS = metrics.counter(
+    "chatapp_ws_events_total", "Websocket events received", ("type",)
+)
+EVENT_ERRORS = metrics.counter(
+    "chatapp_ws_event_errors_total", "Websocket events that raised", ("type",)
+)
+EVENT_LATENCY = metrics.histogram(
+    "chatapp_ws_event_seconds", "Time taken to handle a websocket event", ("type",)
+)
+
+
+async def handle_ws_event(app: web.Application, session: Session, event: dict):
     type = event.get("type", None)
 
     # Handle event type
-    if type == "ping":
-        await handle_ping(app, username, event)
-    elif type == "self":
-        await handle_self(app, username, event)
-    elif type == "add_contact":
-        await handle_add_contact(app, username, event)
-    elif type == "get_contacts":
-        await handle_get_contacts(app, username, event)
-    elif type == "create_conversation":
-        await handle_create_conversation(app, username, event)
-    elif type == "get_conversations":
-        await handle_get_conversations(app, username, event)
-    elif type == "get_conversation_info":
-        await handle_get_conversation_info(app, username, event)
-    elif type == "send_message":
-        await handle_send_message(app, username, event)
-    elif type == "get_messages":
-        await handle_get_messages(app, username, event)
-    else:
-        await utils.send_error(ws, "root", f"no type field found in the event")
+    handler = EVENT_HANDLERS.get(type, None) if isinstance(type, str) else None
+    if handler is None:
+        EVENTS.inc(type="unknown")
+        return await utils.send_error(
+            session.ws, "root", f"no type field found in the event"
+        )
+
+    EVENTS.inc(type=type)
+    start = time.perf_counter()
+    try:
+        await handler(app, session, event)
+    except Exception:
+        EVENT_ERRORS.inc(type=type)
+        raise
+    finally:
+        EVENT_LATENCY.observe(time.perf_counter() - start, type=type)
+
+
+BATCH_MAX_EVENTS = 50  # events per batch, at most
+
+
+class _Replies:
+    # Stands in for the outbound queue, and keeps what a handler replies
+    def __init__(self):
+        self.frames = []
+
+    async def send_json(self, data):
+        self.frames.append(data)
+
+
+async def handle_batch(app: web.Application, session: Session, event: dict):
+    """
+    request schema:
+        {
+            "type": "batch",
+            "events": [ // Handled in order, max 50
+                {
+                    "id": "...", // Client correlation id, string or int
+                    "event": {   // Any event except batch
+                        "type": "get_contacts",
+                        ...
+                    }
+                },
+                ...
+            ]
+        }
+
+    response schema:
+        error schema:
+            {
+                "type": "batch",
+                "success": false,
+                "error": "..." # Error message
+            }
+
+        success schema: one frame with the replies of all the events
+            {
+                "type": "batch",
+                "success": true,
+                "data": [
+                    {
+                        "id": "...",     // Client correlation id
+                        "responses": [   // What the event replied, usually one
+                            {            // frame. Broadcasts (ex: send_message)
+                                "type": "get_contacts", // still arrive as
+                                "success": true,        // separate frames
+                                ...
+                            }
+                        ]
+                    },
+                    ...
+                ]
+            }
+    """
+    ws = session.ws
+
+    # Check if events are valid
+    events = event.get("events", None)
+    if type(events) is not list or len(events) == 0:
+        return await utils.send_error(
+            ws, event["type"], "events value expected as a non empty list"
+        )
+    if len(events) > BATCH_MAX_EVENTS:
+        return await utils.send_error(
+            ws, event["type"], f"a batch can have at most {BATCH_MAX_EVENTS} events"
+        )
+    for item in events:
+        if (
+            type(item) is not dict
+            or type(item.get("id", None)) not in (str, int)
+            or type(item.get("event", None)) is not dict
+        ):
+            return await utils.send_error(
+                ws, event["type"], "every event expected as {id, event}"
+            )
+
+    # Handle the events in order, capturing what they reply
+    res = []
+    for item in events:
+        replies = _Replies()
+        if item["event"].get("type", None) == "batch":
+            await utils.send_error(replies, "batch", "a batch cannot be nested")
+        else:
+            reply_session = Session(
+                replies, session.user_id, session.username, session.fullname
+            )
+            await handle_ws_event(app, reply_session, item["event"])
+        res.append({"id": item["id"], "responses": replies.frames})
+
+    await utils.send_data(ws, event["type"], res)
+
+
+# Registered here, as it dispatches through handle_ws_event
+EVENT_HANDLERS["batch"] = handle_batch
 
 
 async def handle_ws(request: web.Request):
-    db = request.app[DB_KEY]
-    jwtsecret = request.app[JWT_KEY]
+    adb = request.app[ADB_KEY]
+    token_cache = request.app[TOKEN_CACHE_KEY]
     wss = request.app[WSS_KEY]
+    bus = request.app[BUS_KEY]
+    presence = request.app[PRESENCE_KEY]
 
-    ws = web.WebSocketResponse()
+    # The client can ask for a binary wire format in the handshake
+    ws = web.WebSocketResponse(protocols=protocols.offered())
     await ws.prepare(request)
 
     # Check if the request has a valid login-token cookie
@@ -62,61 +197,69 @@ async def handle_ws(request: web.Request):
 
     # Check if the login-token is a valid jwt
     try:
-        decoded_jwt = jwt.decode(login_token, jwtsecret, algorithms="HS256")
+        decoded_jwt = token_cache.decode(login_token)
         username = decoded_jwt["username"]
     except jwt.exceptions.InvalidTokenError:
         await ws.close(message="invalid login-token")
         return ws
 
     # Check if the username acquired from the login-token is valid
-    check = utils.get_user_info(db, username)
-    if check is None:
+    user = await adb.read(utils.get_user_info, username)
+    if user is None:
         await ws.close(message=f"'{username}' doesn't exists")
         return ws
 
-    # Check if websocket is already connected
-    # There can be only one websocket connection per user
-    if username in wss:
-        await ws.close(
-            message=f"'{username}' is already connected. Cannot have multiple instance"
-        )
-        return ws
+    # Everything sent to this websocket goes through its outbound queue, so a
+    # slow client never holds back the sender
+    outbox = Outbox(ws, **request.app[OUTBOX_KEY])
 
-    try:
-        # Keep track of the user's websocket
-        wss[username] = ws
+    # Per connection state, the user never changes for this websocket
+    session = Session(outbox, user[0], user[1], user[2])
 
-        # Set the user as online
-        utils.set_user_status(db, username, True)
+    # A user can be connected from many devices, the presence only changes
+    # with the first connection, on any worker
+    first = username not in wss and not bus.is_remote(username)
 
-        # Send to all the contacts that the username is onlines
-        await utils.send_data_contact(
-            wss, username, db, "user_status", {"username": username, "is_online": True}
-        )
+    try:
+        # Keep track of all the user's websockets, and let the other workers
+        # know about the first one
+        if username not in wss:
+            wss[username] = set()
+            bus.join(username)
+        wss[username].add(outbox)
+
+        if first:
+            # Send to all the contacts that the username is online, unless it
+            # is back within the offline grace period
+            await presence.connect(session.user_id, username)
 
         # Handle all websocket events
         async for msg in ws:
-            if msg.type == aiohttp.WSMsgType.TEXT:
+            if msg.type in (aiohttp.WSMsgType.TEXT, aiohttp.WSMsgType.BINARY):
+                # TEXT frames are json, BINARY frames are msgpack
                 try:
-                    event = msg.json()
-                    if type(event) is not dict:
-                        await utils.send_error(ws, "root", "invalid json event")
-                    else:
-                        await handle_ws_event(request.app, username, event)
-                except json.JSONDecodeError:
-                    await utils.send_error(ws, "root", "invalid json event")
+                    event = protocols.decode(msg.data)
+                except ValueError:
+                    event = None
+                if type(event) is not dict:
+                    format = "json" if msg.type == aiohttp.WSMsgType.TEXT else "msgpack"
+                    await utils.send_error(outbox, "root", f"invalid {format} event")
+                else:
+                    await handle_ws_event(request.app, session, event)
             elif msg.type == aiohttp.WSMsgType.ERROR:
                 print("ws connection closed with exception %s" % ws.exception())
     finally:
-        # Remove user's websocket
-        del wss[username]
+        # Remove user's websocket, the user stays online till the last one
+        outbox.stop()
+        connections = wss[username]
+        connections.discard(outbox)
+        if len(connections) == 0:
+            del wss[username]
+            bus.leave(username)
 
-        # Set the user as offline
-        utils.set_user_status(db, username, False)
-
-        # Send to all the contacts that the username is offline
-        await utils.send_data_contact(
-            wss, username, db, "user_status", {"username": username, "is_online": False}
-        )
+            # The user goes offline after the grace period, unless it
+            # reconnects before
+            if not bus.is_remote(username):
+                presence.disconnect(session.user_id, username)
 
     return ws
@@ -0,0 +1,106 @@
+"""
+Local pub/sub broker for the multi-worker mode. Workers connect over a unix
+domain socket and exchange newline delimited json messages:
+
+- {"op": "hello", "worker": 1}: first message of every worker, answered with
+  {"op": "routes", "routes": {username: [worker, ...]}}
+- {"op": "join", "username": "..."}, {"op": "leave", "username": "..."}:
+  the user connected to, or disconnected from, the sending worker. Relayed
+  to every other worker with the "worker" field set.
+- {"op": "deliver", "worker": 2, "usernames": [...], "frame": "..."}: sent
+  only to the given worker, which writes the frame to the usernames.
+- anything else is relayed as it is to every other worker.
+"""
+
+import os
+import json
+import asyncio
+
+import src.utils.codec as codec
+
+
+class Broker:
+    def __init__(self):
+        self.workers: dict[int, asyncio.StreamWriter] = {}
+        self.routes: dict[str, set[int]] = {}  # username -> workers
+
+    def _send(self, writer: asyncio.StreamWriter, message: dict):
+        writer.write(codec.dumps(message).encode() + b"\n")
+
+    def _relay(self, sender: int, message: dict):
+        for worker, writer in self.workers.items():
+            if worker != sender:
+                self._send(writer, message)
+
+    def _leave(self, worker: int, username: str):
+        workers = self.routes.get(username, None)
+        if workers is None:
+            return
+        workers.discard(worker)
+        if len(workers) == 0:
+            del self.routes[username]
+
+    async def handle_worker(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ):
+        worker = None
+        try:
+            hello = codec.loads(await reader.readline())
+            worker = hello["worker"]
+            self.workers[worker] = writer
+            self._send(
+                writer,
+                {
+                    "op": "routes",
+                    "routes": {u: list(w) for u, w in self.routes.items()},
+                },
+            )
+
+            while line := await reader.readline():
+                message = codec.loads(line)
+                op = message.get("op", None)
+                if op == "deliver":
+                    target = self.workers.get(message["worker"], None)
+                    if target is not None:
+                        self._send(target, message)
+                    continue
+
+                message["worker"] = worker
+                if op == "join":
+                    self.routes.setdefault(message["username"], set()).add(worker)
+                elif op == "leave":
+                    self._leave(worker, message["username"])
+                self._relay(worker, message)
+        except (ConnectionError, json.JSONDecodeError, KeyError):
+            pass
+        finally:
+            # Everyone on this worker is gone
+            if worker is not None and self.workers.get(worker, None) is writer:
+                del self.workers[worker]
+                for username in [u for u, w in self.routes.items() if worker in w]:
+                    self._leave(worker, username)
+                    self._relay(
+                        worker, {"op": "leave", "username": username, "worker": worker}
+                    )
+            writer.close()
+
+
+async def start_broker(path: str) -> asyncio.AbstractServer:
+    # Remove the socket of a previous run
+    if os.path.exists(path):
+        os.remove(path)
+    broker = Broker()
+    return await asyncio.start_unix_server(broker.handle_worker, path=path)
+
+
+async def serve(path: str):
+    server = await start_broker(path)
+    async with server:
+        await server.serve_forever()
+
+
+def run_broker(path: str):
+    try:
+        asyncio.run(serve(path))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,53 @@
+"""
+JSON codec of the websocket events, the broker messages and the http
+payloads. orjson is used when it is installed, it is a lot faster than the
+json module on the message lists that the server sends. Otherwise it falls
+back to the json module, the output is the same json either way.
+
+The codec is picked at startup by the codec config (src/configs/codec.py),
+so callers look up codec.dumps/codec.loads when they are called instead of
+importing them.
+"""
+
+import json
+
+# orjson is optional, without it the json module is used
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+AUTO = "auto"
+ORJSON = "orjson"
+JSON = "json"
+CODECS = (AUTO, ORJSON, JSON)
+
+
+def _orjson_dumps(data) -> str:
+    # orjson gives bytes, TEXT frames and the broker need str. Non str keys
+    # are converted like the json module does
+    return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS).decode()
+
+
+def use(codec: str):
+    """
+    Pick the codec: "orjson", "json", or "auto" for orjson when it is
+    installed. Raises ValueError for an unknown or a missing codec.
+    """
+    global name, dumps, loads
+
+    if codec not in CODECS:
+        raise ValueError(f"unknown json codec '{codec}'")
+    if codec == ORJSON and orjson is None:
+        raise ValueError("json codec 'orjson' is not installed")
+
+    if codec != JSON and orjson is not None:
+        # orjson.JSONDecodeError is a json.JSONDecodeError, so the callers
+        # catch the same errors with both codecs
+        name, dumps, loads = ORJSON, _orjson_dumps, orjson.loads
+    else:
+        name, dumps, loads = JSON, json.dumps, json.loads
+
+
+name: str = JSON
+use(AUTO)
@@ -0,0 +1,54 @@
+import time
+import asyncio
+
+from aiohttp import web
+
+import src.utils.metrics as metrics
+from src.utils.protocols import Frame
+
+BROADCAST_TIMEOUT = 5.0  # seconds, per recipient
+
+FANOUT_SIZE = metrics.histogram(
+    "chatapp_fanout_recipients",
+    "Number of connected recipients per broadcast",
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000),
+)
+FANOUT_LATENCY = metrics.histogram(
+    "chatapp_fanout_delivery_seconds", "Time taken to deliver to one recipient"
+)
+FANOUT_FAILURES = metrics.counter(
+    "chatapp_fanout_failures_total",
+    "Deliveries that timed out or failed",
+    ("reason",),
+)
+
+
+async def _deliver(ws: web.WebSocketResponse, frame: Frame):
+    start = time.perf_counter()
+    try:
+        await ws.send_frame(frame)
+    except ConnectionError:
+        FANOUT_FAILURES.inc(reason="connection")
+        return
+    FANOUT_LATENCY.observe(time.perf_counter() - start)
+
+
+async def broadcast_frame(
+    wss: list[web.WebSocketResponse], frame: Frame, timeout=BROADCAST_TIMEOUT
+):
+    """
+    Send the frame to all the websockets concurrently. A slow recipient only
+    delays itself, and is given up on after timeout seconds.
+
+    The frame is encoded once per wire format, not once per recipient.
+    """
+    FANOUT_SIZE.observe(len(wss))
+    if len(wss) == 0:
+        return
+
+    # All the sends start together, so a single timeout covers every recipient
+    tasks = [asyncio.ensure_future(_deliver(ws, frame)) for ws in wss]
+    _, pending = await asyncio.wait(tasks, timeout=timeout)
+    for task in pending:
+        task.cancel()
+        FANOUT_FAILURES.inc(reason="timeout")
@@ -0,0 +1,183 @@
+import time
+
+
+class Metric:
+    """
+    Base of all the in-process metrics. Values are kept per label values,
+    ex: for labels ("type",) the key of a value is ("send_message",)
+    """
+
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values = {}
+
+    def key(self, labels: dict) -> tuple:
+        return tuple(str(labels[l]) for l in self.labels)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self.key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        return self.values.get(self.key(labels), 0)
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        self.values[self.key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self.key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def get(self, **labels) -> float:
+        return self.values.get(self.key(labels), 0)
+
+
+# Default buckets, in seconds
+LATENCY_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+)
+
+
+class Histogram(Metric):
+    """
+    Cumulative histogram, values holds (bucket counts, sum, count) per key
+    """
+
+    kind = "histogram"
+
+    def __init__(
+        self, name: str, help: str, labels: tuple = (), buckets=LATENCY_BUCKETS
+    ):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        key = self.key(labels)
+        entry = self.values.get(key, None)
+        if entry is None:
+            entry = [[0] * len(self.buckets), 0.0, 0]
+            self.values[key] = entry
+        counts = entry[0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+        entry[1] += value
+        entry[2] += 1
+
+    def count(self, **labels) -> int:
+        entry = self.values.get(self.key(labels), None)
+        return 0 if entry is None else entry[2]
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram, labels: dict):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+
+# All the metrics of this process
+REGISTRY: dict[str, Metric] = {}
+
+
+def _register(metric: Metric):
+    # Modules might be reloaded, keep the first metric with a given name
+    return REGISTRY.setdefault(metric.name, metric)
+
+
+def counter(name: str, help: str, labels: tuple = ()) -> Counter:
+    return _register(Counter(name, help, labels))
+
+
+def gauge(name: str, help: str, labels: tuple = ()) -> Gauge:
+    return _register(Gauge(name, help, labels))
+
+
+def histogram(
+    name: str, help: str, labels: tuple = (), buckets=LATENCY_BUCKETS
+) -> Histogram:
+    return _register(Histogram(name, help, labels, buckets))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    if len(pairs) == 0:
+        return ""
+    return "{" + ",".join(pairs) + "}"
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def render() -> str:
+    """
+    All the metrics of the registry in the prometheus text exposition format
+    """
+    lines = []
+    for metric in REGISTRY.values():
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        # Copy, as the values might change while rendering
+        for key, value in list(metric.values.items()):
+            if metric.kind != "histogram":
+                labels = _labels(metric.labels, key)
+                lines.append(f"{metric.name}{labels} {_number(value)}")
+                continue
+
+            counts, total, count = value
+            for bound, bucket in zip(metric.buckets, counts):
+                labels = _labels(metric.labels, key, f'le="{_number(bound)}"')
+                lines.append(f"{metric.name}_bucket{labels} {bucket}")
+            labels = _labels(metric.labels, key, 'le="+Inf"')
+            lines.append(f"{metric.name}_bucket{labels} {count}")
+            labels = _labels(metric.labels, key)
+            lines.append(f"{metric.name}_sum{labels} {_number(total)}")
+            lines.append(f"{metric.name}_count{labels} {count}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,75 @@
+"""
+Wire formats of the websocket events. The event schemas are the same in
+every format, only the encoding changes:
+
+- json: TEXT frames, the default
+- msgpack: BINARY frames, when the client asks for the "msgpack"
+  subprotocol in the handshake (Sec-WebSocket-Protocol) and msgpack is
+  installed
+"""
+
+import src.utils.codec as codec
+
+# msgpack is optional, without it only json is spoken
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON = "json"
+MSGPACK = "msgpack"
+
+
+def offered() -> tuple:
+    # Subprotocols the server accepts in the websocket handshake
+    return (MSGPACK,) if msgpack is not None else ()
+
+
+def negotiated(ws_protocol: str) -> str:
+    # Format of a websocket, from the subprotocol picked in the handshake
+    return MSGPACK if ws_protocol == MSGPACK else JSON
+
+
+def encode(protocol: str, data):
+    if protocol == MSGPACK:
+        return msgpack.packb(data)
+    return codec.dumps(data)
+
+
+def decode(payload):
+    """
+    Decode a received frame, TEXT frames (str) are json and BINARY frames
+    (bytes) are msgpack. Raises ValueError for invalid payloads.
+    """
+    if isinstance(payload, str):
+        return codec.loads(payload)
+    if msgpack is None:
+        raise ValueError("binary frames are not supported")
+    try:
+        return msgpack.unpackb(payload)
+    except (msgpack.UnpackException, TypeError) as e:
+        # ex: truncated data, or a map with unhashable keys
+        raise ValueError(str(e))
+
+
+class Frame:
+    """
+    Data sent to many websockets, encoded at most once per format however
+    many recipients share that format.
+    """
+
+    __slots__ = ("data", "encoded")
+
+    def __init__(self, data=None, encoded: dict = None):
+        self.data = data
+        self.encoded = encoded if encoded is not None else {}
+
+    def encode(self, protocol: str):
+        payload = self.encoded.get(protocol, None)
+        if payload is None:
+            if self.data is None:
+                # Frames from other workers only come as json
+                self.data = codec.loads(self.encoded[JSON])
+            payload = encode(protocol, self.data)
+            self.encoded[protocol] = payload
+        return payload
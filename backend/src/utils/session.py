@@ -0,0 +1,19 @@
+from src.configs.outbox import Outbox
+
+
+class Session:
+    """
+    State of one websocket connection. It is built once in handle_ws, after
+    the login-token is validated, and passed to every event handler, so the
+    handlers never have to look the user up again.
+
+    ws is the outbound queue of the websocket, see configs/outbox.py
+    """
+
+    __slots__ = ("ws", "user_id", "username", "fullname")
+
+    def __init__(self, ws: Outbox, user_id: int, username: str, fullname: str):
+        self.ws = ws
+        self.user_id = user_id
+        self.username = username
+        self.fullname = fullname
@@ -1,8 +1,13 @@
-import time
 import sqlite3
 
 from aiohttp import web
 
+from src.configs.db import AsyncDB
+from src.configs.bus import BusClient
+from src.configs.members import MembershipCache
+from src.utils.fanout import BROADCAST_TIMEOUT, broadcast_frame
+from src.utils.protocols import Frame
+
 
 async def send_error(ws: web.WebSocketResponse, type: str, msg: str):
     await ws.send_json({"success": False, "type": type, "error": msg})
@@ -12,45 +17,60 @@ async def send_data(ws: web.WebSocketResponse, type: str, any):
     await ws.send_json({"success": True, "type": type, "data": any})
 
 
+async def broadcast(
+    wss: list[web.WebSocketResponse], type: str, any, timeout=BROADCAST_TIMEOUT
+):
+    """
+    Send the data to all the websockets concurrently, see broadcast_frame.
+
+    The frame is encoded once per wire format and shared by the websockets.
+    """
+    frame = Frame({"success": True, "type": type, "data": any})
+    await broadcast_frame(wss, frame, timeout)
+
+
+async def send_data_users(
+    wss: dict[str, set[web.WebSocketResponse]],
+    bus: BusClient,
+    usernames,
+    type: str,
+    any,
+):
+    """
+    Send the data to the usernames connected to this worker, and through the
+    bus to the ones connected to other workers. A user can be connected to
+    more than one worker.
+    """
+    frame = Frame({"success": True, "type": type, "data": any})
+    if bus is not None:
+        bus.deliver(usernames, frame)
+    # Every device of the user gets the frame
+    recipients = [ws for u in usernames for ws in wss.get(u, ())]
+    await broadcast_frame(recipients, frame)
+
+
 async def send_data_convo(
     convo_id: int,
-    wss: dict[str, web.WebSocketResponse],
-    db: sqlite3.Connection,
+    wss: dict[str, set[web.WebSocketResponse]],
+    members: MembershipCache,
     type: str,
     any,
+    bus: BusClient = None,
 ):
-    cur = db.execute(
-        "SELECT users.username FROM members, users WHERE "
-        "members.user_id = users.id AND members.conversation_id = ?",
-        [convo_id],
-    )
-    for res in cur.fetchall():
-        username = res[0]
-        ws = wss.get(username, None)
-        if ws is None:  # Check if websocket exists
-            continue
-        await send_data(ws, type, any)
+    usernames = await members.get_members(convo_id)
+    await send_data_users(wss, bus, usernames, type, any)
 
 
 async def send_data_contact(
-    wss: dict[str, web.WebSocketResponse],
-    username: str,
-    db: sqlite3.Connection,
+    wss: dict[str, set[web.WebSocketResponse]],
+    user_id: int,
+    adb: AsyncDB,
     type: str,
     any,
+    bus: BusClient = None,
 ):
-    user_id = get_user_info(db, username)[0]
-    cur = db.execute(
-        "SELECT users.username FROM users, contacts WHERE "
-        "users.id = contacts.contact_id AND contacts.user_id = ?",
-        [user_id],
-    )
-    for res in cur.fetchall():
-        contact_username = res[0]
-        ws = wss.get(contact_username, None)
-        if ws is None:
-            continue
-        await send_data(ws, type, any)
+    contact_usernames = await adb.read(get_contacts, user_id)
+    await send_data_users(wss, bus, contact_usernames, type, any)
 
 
 def get_user_info(db: sqlite3.Connection, username: str):
@@ -65,19 +85,19 @@ def get_user_info(db: sqlite3.Connection, username: str):
     return res[0]
 
 
-def set_user_status(db: sqlite3.Connection, username: str, is_online: bool) -> str:
-    last_online = int(time.time())
+def set_users_status(db: sqlite3.Connection, statuses: list) -> str:
+    # statuses: (user_id, is_online, last_online) of many users, in one commit
     cur = db.cursor()
     cur.execute("BEGIN")
     try:
-        cur.execute(
-            "UPDATE users SET is_online = ?, last_online = ?  WHERE username = ?",
-            [int(is_online), last_online, username],
+        cur.executemany(
+            "UPDATE users SET is_online = ?, last_online = ?  WHERE id = ?",
+            [(int(is_online), at, user_id) for user_id, is_online, at in statuses],
         )
         cur.execute("COMMIT")
     except sqlite3.Error as e:
         cur.execute("ROLLBACK")
-        return "something went wrong: set_user_status"
+        return "something went wrong: set_users_status"
     return None
 
 
@@ -117,6 +137,16 @@ def get_contacts(db: sqlite3.Connection, user_id: int):
     return [t[0] for t in res]
 
 
+def get_contacts_info(db: sqlite3.Connection, user_id: int):
+    cur = db.execute(
+        "SELECT users.username, users.fullname, users.last_online, users.created_at "
+        "FROM users, contacts "
+        "WHERE users.id = contacts.contact_id AND contacts.user_id = ?",
+        [user_id],
+    )
+    return cur.fetchall()
+
+
 def create_conversation(db: sqlite3.Connection, name: str, members) -> int:
     cur = db.cursor()
 
@@ -142,46 +172,147 @@ def create_conversation(db: sqlite3.Connection, name: str, members) -> int:
     return convo_id
 
 
-def get_conversations(db: sqlite3.Connection, username: str):
-    user_id = get_user_info(db, username)[0]
+PREVIEW_LENGTH = 100  # characters of the last message kept per conversation
+UNREAD_MAX_COUNT = 1000  # unread messages are counted up to this
+
+
+def get_conversations(db: sqlite3.Connection, user_id: int):
+    """
+    Conversations of the user with their last message and unread count, the
+    most recently active first. Conversations without messages come last.
+
+    The unread messages are counted on the messages_conversation_id index,
+    and at most UNREAD_MAX_COUNT of them, so an old unread conversation
+    doesn't cost more than a recent one.
+    """
     cur = db.execute(
-        "SELECT conversations.id, conversations.name FROM members, conversations WHERE "
-        "conversations.id = members.conversation_id AND members.user_id = ?",
-        [user_id],
+        "SELECT conversations.id, conversations.name, conversations.last_message_id, "
+        "conversations.last_message_preview, conversations.last_message_at, "
+        "members.last_read_id, ("
+        "SELECT COUNT(*) FROM (SELECT 1 FROM messages "
+        "WHERE messages.conversation_id = conversations.id "
+        "AND messages.id > members.last_read_id LIMIT ?)"
+        ") FROM members, conversations "
+        "WHERE conversations.id = members.conversation_id AND members.user_id = ? "
+        "ORDER BY conversations.last_message_id DESC, conversations.id DESC",
+        [UNREAD_MAX_COUNT, user_id],
     )
     res = []
     for c in cur.fetchall():
-        res.append({"id": c[0], "name": c[1]})
+        last_message = None
+        if c[2] is not None:
+            last_message = {"id": c[2], "preview": c[3], "sent_at": c[4]}
+        res.append(
+            {
+                "id": c[0],
+                "name": c[1],
+                "last_message": last_message,
+                "last_read_id": c[5],
+                "unread_count": c[6],
+            }
+        )
     return res
 
 
-def has_conversation(db: sqlite3.Connection, username: str, id: int):
-    user_id = get_user_info(db, username)[0]
-    cur = db.execute(
-        "SELECT 1 FROM members WHERE user_id = ? AND conversation_id = ?", [user_id, id]
-    )
-    return len(cur.fetchall()) >= 1
+def mark_read(
+    db: sqlite3.Connection, user_id: int, conversation_id: int, message_id: int
+) -> int:
+    """
+    Move the read position of the user forward, never back. Returns the new
+    last read id.
+    """
+    cur = db.cursor()
+    cur.execute("BEGIN")
+    try:
+        cur.execute(
+            "UPDATE members SET last_read_id = MAX(last_read_id, ?) "
+            "WHERE conversation_id = ? AND user_id = ?",
+            [message_id, conversation_id, user_id],
+        )
+        last_read_id = cur.execute(
+            "SELECT last_read_id FROM members WHERE conversation_id = ? AND user_id = ?",
+            [conversation_id, user_id],
+        ).fetchone()[0]
+        cur.execute("COMMIT")
+    except sqlite3.Error as e:
+        cur.execute("ROLLBACK")
+        print(e)
+        return None
+    return last_read_id
 
 
-def get_conversation_info(db: sqlite3.Connection, convo_id: int):
-    res = {}
+def get_sync(
+    db: sqlite3.Connection,
+    user_id: int,
+    after: int,
+    conversations_after: int,
+    limit: int,
+):
+    """
+    Everything of the user past the cursors, returns
+    (conversations, messages, has_more).
+
+    - conversations: conversations of the user with id > conversations_after,
+      with their members
+    - messages: messages of all the user's conversations with id > after
+
+    Both are in ascending id order and have at most limit entries. Both
+    pages are read in the same transaction, so they are consistent with each
+    other.
+    """
+    cur = db.cursor()
+    cur.execute("BEGIN")
+    try:
+        # One extra row tells if there is another page
+        convo_rows = cur.execute(
+            "SELECT conversations.id, conversations.name FROM members, conversations "
+            "WHERE conversations.id = members.conversation_id AND members.user_id = ? "
+            "AND conversations.id > ? ORDER BY conversations.id LIMIT ?",
+            [user_id, conversations_after, limit + 1],
+        ).fetchall()
+        conversations = {
+            r[0]: {"id": r[0], "name": r[1], "members": []} for r in convo_rows[:limit]
+        }
+
+        # Members of the whole page in one query
+        if len(conversations) > 0:
+            placeholders = ", ".join("?" * len(conversations))
+            for convo_id, username in cur.execute(
+                "SELECT members.conversation_id, users.username FROM members, users "
+                f"WHERE members.user_id = users.id AND members.conversation_id IN ({placeholders})",
+                list(conversations),
+            ):
+                conversations[convo_id]["members"].append(username)
+
+        message_rows = cur.execute(
+            "SELECT messages.id, messages.conversation_id, users.username, messages.reply_id, "
+            "messages.content, messages.sent_at FROM messages, members, users "
+            "WHERE members.conversation_id = messages.conversation_id AND members.user_id = ? "
+            "AND users.id = messages.sender_id AND messages.id > ? "
+            "ORDER BY messages.id LIMIT ?",
+            [user_id, after, limit + 1],
+        ).fetchall()
+    finally:
+        cur.execute("COMMIT")
 
-    # Get conversation name
-    cur = db.execute("SELECT name FROM conversations WHERE id = ?", [convo_id])
-    res["id"] = convo_id
-    res["name"] = cur.fetchone()[0]
-    res["members"] = []
+    messages = [
+        {
+            "id": r[0],
+            "conversation_id": r[1],
+            "sender_username": r[2],
+            "reply_id": r[3],
+            "content": r[4],
+            "sent_at": r[5],
+        }
+        for r in message_rows[:limit]
+    ]
+    has_more = len(convo_rows) > limit or len(message_rows) > limit
+    return list(conversations.values()), messages, has_more
 
-    # Get all the members
-    cur = db.execute(
-        "SELECT users.username FROM users, members WHERE "
-        "users.id = members.user_id AND members.conversation_id = ?",
-        [convo_id],
-    )
-    for u in cur.fetchall():
-        res["members"].append(u[0])
 
-    return res
+def get_conversation_name(db: sqlite3.Connection, convo_id: int):
+    cur = db.execute("SELECT name FROM conversations WHERE id = ?", [convo_id])
+    return cur.fetchone()[0]
 
 
 def has_message(db: sqlite3.Connection, conversation_id: int, message_id: int):
@@ -197,39 +328,109 @@ def add_message(
     conversation_id: int,
     content: str,
     reply_id: int,
-    username: str,
+    sender_id: int,
     sent_at: int,
 ):
-    message_id = None
+    row = (conversation_id, content, reply_id, sender_id, sent_at)
+    return add_messages(db, [row])[0]
+
+
+def add_messages(db: sqlite3.Connection, rows: list):
+    """
+    Insert all the messages in a single transaction. rows is a list of
+    (conversation_id, content, reply_id, sender_id, sent_at).
+
+    The summary of every conversation, and the read position of the
+    senders, are updated in the same transaction.
+
+    Returns the message id per row, or None for every row if the
+    transaction failed.
+    """
+    message_ids = []
     cur = db.cursor()
-    sender_id = get_user_info(db, username)[0]
 
     cur.execute("BEGIN")
     try:
-        cur.execute(
-            "INSERT INTO messages(sender_id, conversation_id, reply_id, sent_at, content) "
-            "VALUES (?, ?, ?, ?, ?)",
-            [sender_id, conversation_id, reply_id, sent_at, content],
+        for conversation_id, content, reply_id, sender_id, sent_at in rows:
+            cur.execute(
+                "INSERT INTO messages(sender_id, conversation_id, reply_id, sent_at, content) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [sender_id, conversation_id, reply_id, sent_at, content],
+            )
+            message_ids.append(cur.lastrowid)
+
+        # Only the last message of every conversation makes it to the summary
+        last = {}
+        read = {}
+        for message_id, (conversation_id, content, _, sender_id, sent_at) in zip(
+            message_ids, rows
+        ):
+            last[conversation_id] = (
+                message_id,
+                content[:PREVIEW_LENGTH],
+                sent_at,
+                conversation_id,
+            )
+            read[(conversation_id, sender_id)] = (
+                message_id,
+                conversation_id,
+                sender_id,
+            )
+        cur.executemany(
+            "UPDATE conversations SET last_message_id = ?, last_message_preview = ?, "
+            "last_message_at = ? WHERE id = ?",
+            list(last.values()),
+        )
+        # A sender has read its own messages
+        cur.executemany(
+            "UPDATE members SET last_read_id = MAX(last_read_id, ?) "
+            "WHERE conversation_id = ? AND user_id = ?",
+            list(read.values()),
         )
         cur.execute("COMMIT")
-        message_id = cur.lastrowid
     except sqlite3.Error as e:
         cur.execute("ROLLBACK")
         print(e)
+        return [None] * len(rows)
 
-    return message_id
+    return message_ids
 
 
-def get_messages(db: sqlite3.Connection, conversation_id: int, before: int):
-    cur = db.execute(
+def get_messages(
+    db: sqlite3.Connection,
+    conversation_id: int,
+    before: int = None,
+    after: int = None,
+    limit: int = 100,
+):
+    """
+    Keyset pagination over the messages of a conversation, returns
+    (messages, has_more).
+
+    Without after, the newest messages (before the given id) come first.
+    With after, the oldest messages after the given id come first, so the
+    next page starts after the last returned id.
+    """
+    query = (
         "SELECT messages.id, users.username, messages.reply_id, messages.content, messages.sent_at "
         "FROM users, messages "
-        "WHERE users.id = messages.sender_id AND messages.conversation_id = ? AND messages.id < ? "
-        "ORDER BY messages.id DESC "
-        "LIMIT 100",
-        [conversation_id, before],
+        "WHERE users.id = messages.sender_id AND messages.conversation_id = ?"
     )
-    return [
+    params = [conversation_id]
+    if before is not None:
+        query += " AND messages.id < ?"
+        params.append(before)
+    if after is not None:
+        query += " AND messages.id > ?"
+        params.append(after)
+    query += " ORDER BY messages.id " + ("ASC" if after is not None else "DESC")
+
+    # One extra row tells if there is another page
+    query += " LIMIT ?"
+    params.append(limit + 1)
+
+    rows = db.execute(query, params).fetchall()
+    messages = [
         {
             "id": r[0],
             "sender_username": r[1],
@@ -237,5 +438,83 @@ def get_messages(db: sqlite3.Connection, conversation_id: int, before: int):
             "content": r[3],
             "sent_at": r[4],
         }
-        for r in cur.fetchall()
+        for r in rows[:limit]
+    ]
+    return messages, len(rows) > limit
+
+
+SEARCH_MAX_FILTER = 1000  # conversation ids put in the MATCH, at most
+
+
+def to_match_query(query: str, conversation_ids=None) -> str:
+    """
+    Turn user input into a FTS5 query: every word is matched as a quoted
+    string in the content, so the FTS5 operators and syntax errors can't be
+    triggered. With conversation_ids, only the messages of those
+    conversations match.
+    """
+    words = " ".join('"' + w.replace('"', '""') + '"' for w in query.split())
+    match = f"content : ({words})"
+    if conversation_ids is not None:
+        ids = " OR ".join(f'"{int(c)}"' for c in conversation_ids)
+        match += f" AND conversation_id : ({ids})"
+    return match
+
+
+def search_messages(
+    db: sqlite3.Connection,
+    user_id: int,
+    query: str,
+    conversation_ids: list,
+    offset: int,
+    limit: int,
+):
+    """
+    Messages of the user's conversations that contain all the words of the
+    query, best match (bm25) first. Returns (messages, has_more)
+
+    conversation_ids are the conversations to search in, they are filtered
+    inside the MATCH so that common words don't rank the matches of every
+    other conversation. The members join keeps the results limited to the
+    user's conversations in any case.
+    """
+    if len(conversation_ids) == 0:
+        return [], False
+    if len(conversation_ids) > SEARCH_MAX_FILTER:
+        conversation_ids = None
+
+    sql = (
+        "SELECT messages.id, messages.conversation_id, users.username, messages.reply_id, "
+        "messages.content, messages.sent_at FROM messages_fts "
+        "JOIN messages ON messages.id = messages_fts.rowid "
+        "JOIN members ON members.conversation_id = messages.conversation_id "
+        "AND members.user_id = ? "
+        "JOIN users ON users.id = messages.sender_id "
+        "WHERE messages_fts MATCH ?"
+    )
+    params = [user_id, to_match_query(query, conversation_ids)]
+
+    # Only the content is ranked. One extra row tells if there is another page
+    sql += " ORDER BY bm25(messages_fts, 1.0, 0.0), messages.id DESC LIMIT ? OFFSET ?"
+    params += [limit + 1, offset]
+
+    rows = db.execute(sql, params).fetchall()
+    messages = [
+        {
+            "id": r[0],
+            "conversation_id": r[1],
+            "sender_username": r[2],
+            "reply_id": r[3],
+            "content": r[4],
+            "sent_at": r[5],
+        }
+        for r in rows[:limit]
     ]
+    return messages, len(rows) > limit
+
+
+def rebuild_search_index(db: sqlite3.Connection):
+    # Rebuild the message search index from the messages table, and merge
+    # its segments for faster queries
+    db.execute("INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')")
+    db.execute("INSERT INTO messages_fts(messages_fts) VALUES ('optimize')")
@@ -0,0 +1,60 @@
+import os
+import shutil
+import asyncio
+
+from aiohttp.test_utils import AioHTTPTestCase
+
+from src.app import create_app
+from src.configs.batcher import BATCHER_KEY, BATCH_SIZE
+
+
+class TestBatcherConfig(AioHTTPTestCase):
+    async def get_application(self):
+        # Set a custom db path for the webapp
+        self.dbpath = ".test/this_is_a_test.db"
+        os.environ["DBPATH"] = self.dbpath
+        shutil.rmtree(os.path.dirname(self.dbpath), ignore_errors=True)
+
+        # Create the app
+        app = create_app()
+        return app
+
+    async def test_batcher_disabled(self):
+        batcher = self.app[BATCHER_KEY]
+        self.assertEqual(batcher.window, 0)
+
+        # Check if every message is committed on its own
+        batches = BATCH_SIZE.count()
+        ids = await asyncio.gather(
+            *[batcher.add_message(1, f"message {i}", None, 1, 0) for i in range(5)]
+        )
+        self.assertEqual(sorted(ids), [1, 2, 3, 4, 5])
+        self.assertEqual(BATCH_SIZE.count(), batches + 5)
+
+    async def test_batcher_window(self):
+        batcher = self.app[BATCHER_KEY]
+        batcher.window = 0.05
+
+        # Check if concurrent messages are committed in one batch
+        batches = BATCH_SIZE.count()
+        ids = await asyncio.gather(
+            *[batcher.add_message(1, f"message {i}", None, 1, 0) for i in range(10)]
+        )
+        self.assertEqual(ids, list(range(1, 11)))
+        self.assertEqual(BATCH_SIZE.count(), batches + 1)
+
+        # Check if a full batch is committed without waiting for the window
+        batcher.window = 10
+        batcher.max_rows = 4
+        ids = await asyncio.wait_for(
+            asyncio.gather(
+                *[batcher.add_message(1, f"message {i}", None, 1, 0) for i in range(4)]
+            ),
+            timeout=5,
+        )
+        self.assertEqual(ids, list(range(11, 15)))
+
+    async def tearDownAsync(self):
+        # Remove the dbpath
+        shutil.rmtree(os.path.dirname(self.dbpath))
+        return await super().tearDownAsync()
@@ -0,0 +1,70 @@
+import os
+import json
+import asyncio
+import tempfile
+import unittest
+
+from src.configs.bus import BusClient
+from src.utils.broker import start_broker
+from src.utils.protocols import Frame
+
+
+class FakeWS:
+    def __init__(self):
+        self.sent = []
+
+    async def send_frame(self, frame):
+        self.sent.append(json.loads(frame.encode("json")))
+
+
+async def settle(condition):
+    # The bus is asynchronous, wait a bit for the messages to go through
+    for _ in range(100):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+
+
+class TestBus(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "bus.sock")
+        self.server = await start_broker(self.path)
+
+    async def test_bus(self):
+        ws = FakeWS()
+        one = BusClient(1, {"abc": {ws}})
+        two = BusClient(2, {})
+        await one.connect(self.path)
+        one.join("abc")
+        await asyncio.sleep(0.05)
+
+        # Check if a late worker gets the routing table on connect
+        await two.connect(self.path)
+        self.assertEqual(two.routes, {"abc": {1}})
+        self.assertTrue(two.is_online("abc"))
+        self.assertTrue(two.is_remote("abc"))
+        self.assertFalse(one.is_remote("abc"))
+
+        # Check if a frame reaches the user on the other worker
+        two.deliver(["abc", "pqr"], Frame({"type": "ping"}))
+        await settle(lambda: len(ws.sent) > 0)
+        self.assertEqual(ws.sent, [{"type": "ping"}])
+
+        # Check if published messages reach the handlers of other workers
+        received = []
+        one.handlers["add_conversation"] = received.append
+        two.publish("add_conversation", id=1, members=["abc"])
+        await settle(lambda: len(received) > 0)
+        self.assertEqual(received[0]["members"], ["abc"])
+
+        # Check if the users of a closed worker are dropped
+        await one.close()
+        await settle(lambda: "abc" not in two.routes)
+        self.assertFalse(two.is_online("abc"))
+        await two.close()
+
+    async def asyncTearDown(self):
+        self.server.close()
+        await self.server.wait_closed()
+        self.tmpdir.cleanup()
@@ -0,0 +1,42 @@
+import json
+import unittest
+
+import src.utils.codec as codec
+
+
+class TestCodec(unittest.TestCase):
+    def tearDown(self):
+        codec.use(codec.AUTO)
+
+    def test_codec(self):
+        data = {
+            "success": True,
+            "type": "send_message",
+            "data": {"id": 1, "reply_id": None, "content": "héllo 👋", "sent_at": 2},
+        }
+        codecs = [codec.JSON]
+        if codec.orjson is not None:
+            codecs.append(codec.ORJSON)
+
+        # Check if every codec gives str json that any json parser reads back
+        for name in codecs:
+            codec.use(name)
+            self.assertEqual(codec.name, name)
+            text = codec.dumps(data)
+            self.assertIsInstance(text, str)
+            self.assertEqual(json.loads(text), data)
+            self.assertEqual(codec.loads(text), data)
+
+            # Check if invalid json raises the error of the json module
+            with self.assertRaises(json.JSONDecodeError):
+                codec.loads("{not json")
+
+    def test_codec_auto(self):
+        # Check if auto prefers orjson when it is installed
+        codec.use(codec.AUTO)
+        expected = codec.ORJSON if codec.orjson is not None else codec.JSON
+        self.assertEqual(codec.name, expected)
+
+        # Check if an unknown codec is rejected
+        with self.assertRaises(ValueError):
+            codec.use("simplejson")
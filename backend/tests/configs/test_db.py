@@ -5,7 +5,8 @@ import sqlite3
 from aiohttp.test_utils import AioHTTPTestCase
 
 from src.app import create_app
-from src.configs.db import DBPATH_KEY, DB_KEY
+from src.configs.db import DBPATH_KEY, DBPROFILE_KEY, ADB_KEY, get_storage_profile
+import src.configs.migrations as migrations
 
 
 class TestDBConfig(AioHTTPTestCase):
@@ -26,11 +27,143 @@ class TestDBConfig(AioHTTPTestCase):
 
         # Check if the tables are created
         final_tables = ["users", "contacts", "conversations", "members", "messages"]
+        # The message search index and its fts5 shadow tables
+        final_tables += [
+            "messages_fts",
+            "messages_fts_data",
+            "messages_fts_idx",
+            "messages_fts_docsize",
+            "messages_fts_config",
+        ]
         with sqlite3.connect(self.dbpath) as conn:
             cur = conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
             tables = cur.fetchall()
             self.assertEqual(set(final_tables), set([t[0] for t in tables]))
 
+    async def test_migrations(self):
+        with sqlite3.connect(self.dbpath) as conn:
+            # Check if all the migrations are applied
+            version = migrations.get_version(conn)
+            self.assertEqual(version, migrations.MIGRATIONS[-1][0])
+
+            # Check if the hot-path indexes are created
+            cur = conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")
+            indexes = set([r[0] for r in cur.fetchall()])
+            self.assertTrue(
+                {
+                    "messages_conversation_id",
+                    "members_user_conversation",
+                    "messages_reply_id",
+                }
+                <= indexes
+            )
+
+            # Check if get_messages uses the index
+            cur = conn.execute(
+                "EXPLAIN QUERY PLAN SELECT id FROM messages "
+                "WHERE conversation_id = 1 AND id < 10 ORDER BY id DESC"
+            )
+            plan = " ".join([r[3] for r in cur.fetchall()])
+            self.assertIn("messages_conversation_id", plan)
+
+        # Check if migrations are applied only once
+        with sqlite3.connect(self.dbpath, isolation_level=None) as conn:
+            self.assertEqual(migrations.migrate(conn), [])
+
+    async def test_migration_summaries(self):
+        # A database with messages from before the conversation summaries
+        conn = sqlite3.connect(":memory:", isolation_level=None)
+        for _, _, statements in migrations.MIGRATIONS[:3]:
+            for statement in statements:
+                conn.execute(statement)
+        conn.execute("PRAGMA user_version = 3")
+        conn.execute(
+            "INSERT INTO users(username, fullname, password) VALUES ('abc', 'user1', 'xyz')"
+        )
+        conn.execute("INSERT INTO conversations(name) VALUES ('convo1'), ('convo2')")
+        conn.execute("INSERT INTO members VALUES (1, 1), (2, 1)")
+        conn.execute(
+            "INSERT INTO messages(sender_id, conversation_id, sent_at, content) "
+            "VALUES (1, 1, 10, 'first'), (1, 1, 20, ?)",
+            ["x" * 150],
+        )
+        migrations.migrate(conn)
+
+        # Check if the summaries are filled in, and old messages count as read
+        rows = conn.execute(
+            "SELECT id, last_message_id, last_message_preview, last_message_at "
+            "FROM conversations ORDER BY id"
+        ).fetchall()
+        self.assertEqual(rows, [(1, 2, "x" * 100, 20), (2, None, None, None)])
+        rows = conn.execute(
+            "SELECT conversation_id, last_read_id FROM members ORDER BY conversation_id"
+        ).fetchall()
+        self.assertEqual(rows, [(1, 2), (2, 0)])
+        conn.close()
+
+    async def test_storage_profile(self):
+        adb = self.server.app[ADB_KEY]
+        profile = self.server.app[DBPROFILE_KEY]
+
+        def get_pragmas(db: sqlite3.Connection):
+            return (
+                db.execute("PRAGMA journal_mode").fetchone()[0],
+                db.execute("PRAGMA busy_timeout").fetchone()[0],
+                db.execute("PRAGMA cache_size").fetchone()[0],
+            )
+
+        # Check if the writer and the readers are tuned by the profile
+        pragmas = ("wal", profile["busy_timeout"], profile["cache_size"])
+        self.assertEqual(await adb.write(get_pragmas), pragmas)
+        self.assertEqual(await adb.read(get_pragmas), pragmas)
+
+        # Check if profile values can be overridden
+        os.environ["DB_SYNCHRONOUS"] = "FULL"
+        try:
+            self.assertEqual(get_storage_profile()["synchronous"], "FULL")
+        finally:
+            del os.environ["DB_SYNCHRONOUS"]
+
+    async def test_async_db(self):
+        adb = self.server.app[ADB_KEY]
+
+        def insert_user(db: sqlite3.Connection, username: str):
+            cur = db.execute(
+                "INSERT INTO users(username, fullname, password) VALUES (?, ?, ?)",
+                [username, "user1", "xyz"],
+            )
+            return cur.lastrowid
+
+        def get_usernames(db: sqlite3.Connection):
+            cur = db.execute("SELECT username FROM users")
+            return [r[0] for r in cur.fetchall()]
+
+        # Check if the writes are visible to later reads
+        id = await adb.write(insert_user, "abc")
+        self.assertEqual(id, 1)
+        self.assertEqual(await adb.read(get_usernames), ["abc"])
+
+        # Check if the reads run on read-only connections
+        with self.assertRaises(sqlite3.OperationalError):
+            await adb.read(insert_user, "pqr")
+        self.assertEqual(await adb.read(get_usernames), ["abc"])
+
+    async def test_async_db_close(self):
+        adb = self.server.app[ADB_KEY]
+
+        def get_one(db: sqlite3.Connection):
+            return db.execute("SELECT 1").fetchone()[0]
+
+        self.assertEqual(await adb.read(get_one), 1)
+        self.assertEqual(await adb.write(get_one), 1)
+
+        # Check if close shuts down the executors
+        adb.close()
+        with self.assertRaises(RuntimeError):
+            await adb.read(get_one)
+        with self.assertRaises(RuntimeError):
+            await adb.write(get_one)
+
     async def tearDownAsync(self):
         # Remove the dbpath
         shutil.rmtree(os.path.dirname(self.dbpath))
@@ -1,10 +1,12 @@
 import os
+import time
 import shutil
 
+import jwt
 from aiohttp.test_utils import AioHTTPTestCase
 
 from src.app import create_app
-from src.configs.jwt import JWT_KEY
+from src.configs.jwt import JWT_KEY, TokenCache, TOKEN_CACHE_LOOKUPS
 
 
 class TestJWTConfig(AioHTTPTestCase):
@@ -26,6 +28,39 @@ class TestJWTConfig(AioHTTPTestCase):
         # Check if jwt secret is correctly part of the app config
         self.assertEqual(self.jwtsecret, self.app[JWT_KEY])
 
+    async def test_token_cache(self):
+        token_cache = TokenCache(self.jwtsecret, 2)
+        exp = int(time.time()) + 60
+        tokens = [
+            jwt.encode({"username": u, "exp": exp}, self.jwtsecret)
+            for u in ["abc", "pqr", "uvw"]
+        ]
+
+        # Check if a token is only decoded once
+        hits = TOKEN_CACHE_LOOKUPS.get(result="hit")
+        misses = TOKEN_CACHE_LOOKUPS.get(result="miss")
+        self.assertEqual(token_cache.decode(tokens[0])["username"], "abc")
+        self.assertEqual(token_cache.decode(tokens[0])["username"], "abc")
+        self.assertEqual(TOKEN_CACHE_LOOKUPS.get(result="hit"), hits + 1)
+        self.assertEqual(TOKEN_CACHE_LOOKUPS.get(result="miss"), misses + 1)
+
+        # Check if the least recently used token is evicted
+        token_cache.decode(tokens[1])
+        token_cache.decode(tokens[0])
+        token_cache.decode(tokens[2])
+        self.assertEqual(set(token_cache.tokens), {tokens[0], tokens[2]})
+
+        # Check if invalid tokens are rejected and never cached
+        with self.assertRaises(jwt.exceptions.InvalidTokenError):
+            token_cache.decode(tokens[0] + "x")
+        self.assertNotIn(tokens[0] + "x", token_cache.tokens)
+
+        # Check if a cached token is rejected once expired
+        token_cache.tokens[tokens[0]]["exp"] = time.time() - 1
+        with self.assertRaises(jwt.exceptions.ExpiredSignatureError):
+            token_cache.decode(tokens[0])
+        self.assertNotIn(tokens[0], token_cache.tokens)
+
     async def tearDownAsync(self):
         # Remove the dbpath
         shutil.rmtree(os.path.dirname(self.dbpath))
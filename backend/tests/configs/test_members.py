@@ -0,0 +1,65 @@
+import os
+import shutil
+
+from aiohttp.test_utils import AioHTTPTestCase
+
+from src.app import create_app
+from src.configs.db import ADB_KEY
+from src.configs.members import MEMBERS_KEY, CACHE_LOOKUPS
+import src.utils.utils as utils
+
+
+class TestMembersConfig(AioHTTPTestCase):
+    async def get_application(self):
+        # Set a custom db path for the webapp
+        self.dbpath = ".test/this_is_a_test.db"
+        os.environ["DBPATH"] = self.dbpath
+        shutil.rmtree(os.path.dirname(self.dbpath), ignore_errors=True)
+
+        # Create the app
+        app = create_app()
+        return app
+
+    async def test_members(self):
+        adb = self.app[ADB_KEY]
+        members = self.app[MEMBERS_KEY]
+
+        # Add the usernames directly, hashing is not part of this test
+        for username in ["abc", "pqr", "uvw"]:
+            await adb.write(
+                lambda db, u: db.execute(
+                    "INSERT INTO users(username, fullname, password) VALUES (?, ?, ?)",
+                    [u, u, "xyz"],
+                ),
+                username,
+            )
+        convo_id = await adb.write(utils.create_conversation, "convo1", ["abc", "pqr"])
+
+        # Check if the cache is warmed lazily
+        self.assertEqual(await members.get_members(convo_id), {"abc", "pqr"})
+        self.assertEqual(await members.get_conversations("uvw"), set())
+        self.assertTrue(await members.is_member("abc", convo_id))
+        self.assertFalse(await members.is_member("uvw", convo_id))
+
+        # Check if warm lookups don't miss
+        misses = CACHE_LOOKUPS.get(result="miss")
+        self.assertTrue(await members.is_member("pqr", convo_id))
+        self.assertFalse(await members.is_member("uvw", convo_id))
+        self.assertEqual(CACHE_LOOKUPS.get(result="miss"), misses)
+
+        # Check if a new conversation updates the warm entries
+        new_id = await adb.write(utils.create_conversation, "convo2", ["uvw", "abc"])
+        members.add_conversation(new_id, ["uvw", "abc"])
+        self.assertEqual(await members.get_conversations("uvw"), {new_id})
+        self.assertTrue(await members.is_member("uvw", new_id))
+
+        # Check if invalidation drops the entries
+        members.invalidate_conversation(new_id)
+        self.assertNotIn(new_id, members.convo_members)
+        self.assertNotIn("uvw", members.user_convos)
+        self.assertTrue(await members.is_member("uvw", new_id))
+
+    async def tearDownAsync(self):
+        # Remove the dbpath
+        shutil.rmtree(os.path.dirname(self.dbpath))
+        return await super().tearDownAsync()
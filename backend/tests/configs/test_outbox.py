@@ -0,0 +1,99 @@
+import json
+import asyncio
+import unittest
+
+from src.configs.outbox import Outbox, OUTBOX_DROPS
+
+
+class SlowWS:
+    # Blocks every send until the gate is opened
+    ws_protocol = None  # json
+
+    def __init__(self):
+        self.gate = asyncio.Event()
+        self.sent = []
+        self.closed = False
+
+    async def send_str(self, data):
+        await self.gate.wait()
+        self.sent.append(json.loads(data))
+
+    async def close(self, **kwargs):
+        self.closed = True
+
+
+def status(username: str, is_online: bool):
+    return {
+        "success": True,
+        "type": "user_status",
+        "data": {"username": username, "is_online": is_online},
+    }
+
+
+class TestOutbox(unittest.IsolatedAsyncioTestCase):
+    async def test_outbox(self):
+        ws = SlowWS()
+        outbox = Outbox(ws, 4, "drop_oldest")
+
+        # Check if sending doesn't wait for the client
+        for i in range(3):
+            await outbox.send_json({"type": "ping", "data": i})
+        ws.gate.set()
+        await asyncio.sleep(0.05)
+        self.assertEqual([f["data"] for f in ws.sent], [0, 1, 2])
+        outbox.stop()
+
+    async def test_outbox_drop_oldest(self):
+        ws = SlowWS()
+        outbox = Outbox(ws, 4, "drop_oldest")
+        drops = OUTBOX_DROPS.get(policy="drop_oldest")
+
+        # The writer holds the first frame, the queue keeps the newest ones
+        await outbox.send_json({"type": "ping", "data": 0})
+        await asyncio.sleep(0.01)
+        for i in range(1, 7):
+            await outbox.send_json({"type": "ping", "data": i})
+        self.assertEqual(len(outbox.queue), 4)
+        self.assertEqual(OUTBOX_DROPS.get(policy="drop_oldest"), drops + 2)
+
+        ws.gate.set()
+        await asyncio.sleep(0.05)
+        self.assertEqual([f["data"] for f in ws.sent], [0, 3, 4, 5, 6])
+        outbox.stop()
+
+    async def test_outbox_coalesce(self):
+        ws = SlowWS()
+        outbox = Outbox(ws, 3, "coalesce")
+
+        # Older presence updates of the same user are dropped first
+        await outbox.send_json({"type": "ping", "data": 0})
+        await asyncio.sleep(0.01)
+        await outbox.send_json(status("abc", True))
+        await outbox.send_json({"type": "ping", "data": 1})
+        await outbox.send_json(status("pqr", True))
+        await outbox.send_json(status("abc", False))
+
+        ws.gate.set()
+        await asyncio.sleep(0.05)
+        self.assertEqual(
+            ws.sent,
+            [
+                {"type": "ping", "data": 0},
+                {"type": "ping", "data": 1},
+                status("pqr", True),
+                status("abc", False),
+            ],
+        )
+        outbox.stop()
+
+    async def test_outbox_disconnect(self):
+        ws = SlowWS()
+        outbox = Outbox(ws, 2, "disconnect")
+
+        # A full queue closes the connection and drops everything
+        for i in range(4):
+            await outbox.send_json({"type": "ping", "data": i})
+        await asyncio.sleep(0.01)
+        self.assertTrue(ws.closed)
+        self.assertTrue(outbox.stopped)
+        self.assertEqual(len(outbox.queue), 0)
@@ -0,0 +1,75 @@
+import os
+import shutil
+
+from aiohttp.test_utils import AioHTTPTestCase
+
+from src.app import create_app
+from src.configs.passhasher import PASSHASHER_KEY, HashQueueFull, HashUnavailable
+
+
+class TestPassHasherConfig(AioHTTPTestCase):
+    async def get_application(self):
+        # Set a custom db path for the webapp
+        self.dbpath = ".test/this_is_a_test.db"
+        os.environ["DBPATH"] = self.dbpath
+        shutil.rmtree(os.path.dirname(self.dbpath), ignore_errors=True)
+
+        # Create the app
+        app = create_app()
+        return app
+
+    async def test_passhasher(self):
+        passhasher = self.app[PASSHASHER_KEY]
+
+        # Check if hashing and verification works through the pool
+        passhash = await passhasher.hash("xyz")
+        self.assertTrue(await passhasher.verify(passhash, "xyz"))
+        self.assertFalse(await passhasher.verify(passhash, "abc"))
+        self.assertEqual(passhasher.pending, 0)
+
+    async def test_passhasher_queue_full(self):
+        passhasher = self.app[PASSHASHER_KEY]
+
+        # Add a username, so that login reaches the password verification
+        async with self.client.post(
+            "/register", json={"username": "pqr", "password": "xyz", "fullname": "123"}
+        ) as res:
+            self.assertEqual(res.status, 201)
+
+        passhasher.max_queue = 0
+
+        # Check if the service rejects new jobs
+        with self.assertRaises(HashQueueFull):
+            await passhasher.hash("xyz")
+        self.assertEqual(passhasher.rejected, 1)
+
+        # Check if register sends service unavailable
+        async with self.client.post(
+            "/register", json={"username": "abc", "password": "xyz", "fullname": "123"}
+        ) as res:
+            self.assertEqual(res.status, 503)
+            self.assertEqual(await res.text(), "server busy, try again later")
+
+        # Check if login sends service unavailable
+        async with self.client.post(
+            "/auth/login", json={"username": "pqr", "password": "xyz"}
+        ) as res:
+            self.assertEqual(res.status, 503)
+            self.assertEqual(await res.text(), "server busy, try again later")
+
+    async def test_passhasher_broken_pool(self):
+        passhasher = self.app[PASSHASHER_KEY]
+
+        # Kill a worker process while it runs a job
+        with self.assertRaises(HashUnavailable):
+            await passhasher._submit(os._exit, 1)
+        self.assertEqual(passhasher.pending, 0)
+
+        # Check if the pool was recreated
+        passhash = await passhasher.hash("xyz")
+        self.assertTrue(await passhasher.verify(passhash, "xyz"))
+
+    async def tearDownAsync(self):
+        # Remove the dbpath
+        shutil.rmtree(os.path.dirname(self.dbpath))
+        return await super().tearDownAsync()
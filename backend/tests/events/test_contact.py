@@ -134,6 +134,46 @@ class TestWSContactEvent(AioHTTPTestCase):
                     == set([u["username"] for u in res["data"]["contacts"]])
                 )
 
+    async def test_get_contacts_is_online(self):
+        # Create login sessions
+        tokens = {}
+        for username in ["abc", "pqr"]:
+            async with self.client.post(
+                "/auth/login", json={"username": username, "password": "xyz"}
+            ) as res:
+                self.assertEqual(res.status, 202)
+                tokens[username] = res.cookies.get("login-token").value
+
+        async with ClientSession(
+            self.client.make_url(""), cookies={"login-token": tokens["abc"]}
+        ) as session:
+            async with session.ws_connect("/ws") as ws:
+                # Add contacts
+                for contact_username in ["pqr", "uvw"]:
+                    await ws.send_json(
+                        {"type": "add_contact", "contact_username": contact_username}
+                    )
+                    res = await ws.receive_json()
+                    self.assertEqual(res["success"], True)
+
+                # Connect as pqr, and check if abc sees it online
+                async with ClientSession(
+                    self.client.make_url(""), cookies={"login-token": tokens["pqr"]}
+                ) as pqr_session:
+                    async with pqr_session.ws_connect("/ws") as _:
+                        res = await ws.receive_json()
+                        self.assertEqual(res["type"], "user_status")
+
+                        await ws.send_json({"type": "get_contacts"})
+                        res = await ws.receive_json()
+                        self.assertEqual(res["success"], True)
+                        self.assertEqual(res["type"], "get_contacts")
+                        contacts = {c["username"]: c for c in res["data"]["contacts"]}
+                        self.assertEqual(contacts["pqr"]["is_online"], True)
+                        self.assertEqual(contacts["pqr"]["fullname"], "user2")
+                        self.assertEqual(contacts["uvw"]["is_online"], False)
+                        self.assertEqual(contacts["uvw"]["fullname"], "user3")
+
     async def tearDownAsync(self):
         # Remove the dbpath
         shutil.rmtree(os.path.dirname(self.dbpath))
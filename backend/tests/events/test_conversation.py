@@ -136,6 +136,122 @@ class TestWSConversationEvent(AioHTTPTestCase):
                     res["error"], f"abc is not part of any conversation with 3 id"
                 )
 
+    async def test_conversation_summaries(self):
+        # Create the login sessions
+        tokens = {}
+        for username in ["abc", "pqr"]:
+            async with self.client.post(
+                "/auth/login", json={"username": username, "password": "xyz"}
+            ) as res:
+                self.assertEqual(res.status, 202)
+                tokens[username] = res.cookies.get("login-token").value
+
+        async with ClientSession(
+            self.client.make_url(""), cookies={"login-token": tokens["abc"]}
+        ) as abc_session, ClientSession(
+            self.client.make_url(""), cookies={"login-token": tokens["pqr"]}
+        ) as pqr_session:
+            async with abc_session.ws_connect("/ws") as abc_ws, pqr_session.ws_connect(
+                "/ws"
+            ) as pqr_ws:
+                # Create two conversations, and send messages in the first one
+                convo_ids = []
+                for name in ["convo1", "convo2"]:
+                    await abc_ws.send_json(
+                        {
+                            "type": "create_conversation",
+                            "name": name,
+                            "members": ["pqr"],
+                        }
+                    )
+                    res = await abc_ws.receive_json()
+                    self.assertEqual(res["success"], True)
+                    convo_ids.append(res["data"]["id"])
+                    await pqr_ws.receive_json()
+
+                message_ids = []
+                for content in ["hello", "how are you?", "x" * 150]:
+                    await abc_ws.send_json(
+                        {
+                            "type": "send_message",
+                            "conversation_id": convo_ids[0],
+                            "content": content,
+                        }
+                    )
+                    res = await abc_ws.receive_json()
+                    self.assertEqual(res["success"], True)
+                    message_ids.append(res["data"]["id"])
+                    await pqr_ws.receive_json()
+
+                # Check if the active conversation comes first, with its summary
+                await pqr_ws.send_json({"type": "get_conversations"})
+                res = await pqr_ws.receive_json()
+                self.assertEqual(res["success"], True)
+                self.assertEqual([c["id"] for c in res["data"]], convo_ids)
+                convo = res["data"][0]
+                self.assertEqual(convo["last_message"]["id"], message_ids[-1])
+                self.assertEqual(convo["last_message"]["preview"], "x" * 100)
+                self.assertEqual(convo["unread_count"], 3)
+                self.assertEqual(res["data"][1]["last_message"], None)
+                self.assertEqual(res["data"][1]["unread_count"], 0)
+
+                # The sender has read its own messages
+                await abc_ws.send_json({"type": "get_conversations"})
+                res = await abc_ws.receive_json()
+                self.assertEqual(res["data"][0]["unread_count"], 0)
+                self.assertEqual(res["data"][0]["last_read_id"], message_ids[-1])
+
+                # Mark the first message as read
+                await pqr_ws.send_json(
+                    {
+                        "type": "mark_read",
+                        "conversation_id": convo_ids[0],
+                        "message_id": message_ids[0],
+                    }
+                )
+                res = await pqr_ws.receive_json()
+                self.assertEqual(res["success"], True)
+                self.assertEqual(res["type"], "mark_read")
+                self.assertEqual(
+                    res["data"],
+                    {"conversation_id": convo_ids[0], "last_read_id": message_ids[0]},
+                )
+
+                # Check if the read position never moves back
+                await pqr_ws.send_json(
+                    {
+                        "type": "mark_read",
+                        "conversation_id": convo_ids[0],
+                        "message_id": message_ids[1],
+                    }
+                )
+                await pqr_ws.receive_json()
+                await pqr_ws.send_json(
+                    {
+                        "type": "mark_read",
+                        "conversation_id": convo_ids[0],
+                        "message_id": message_ids[0],
+                    }
+                )
+                res = await pqr_ws.receive_json()
+                self.assertEqual(res["data"]["last_read_id"], message_ids[1])
+
+                await pqr_ws.send_json({"type": "get_conversations"})
+                res = await pqr_ws.receive_json()
+                self.assertEqual(res["data"][0]["unread_count"], 1)
+
+                # A message of another conversation can't be marked as read
+                await pqr_ws.send_json(
+                    {
+                        "type": "mark_read",
+                        "conversation_id": convo_ids[1],
+                        "message_id": message_ids[0],
+                    }
+                )
+                res = await pqr_ws.receive_json()
+                self.assertEqual(res["success"], False)
+                self.assertEqual(res["type"], "mark_read")
+
     async def tearDownAsync(self):
         # Remove the dbpath
         shutil.rmtree(os.path.dirname(self.dbpath))
@@ -128,6 +128,137 @@ class TestWSMessageEvent(AioHTTPTestCase):
                 self.assertEqual(res["data"]["conversation_id"], conversation_id)
                 self.assertTrue(len(res["data"]["messages"]) == 1)
 
+                # Page forward from a known message id
+                await ws.send_json(
+                    {
+                        "type": "get_messages",
+                        "conversation_id": conversation_id,
+                        "after": 1,
+                    }
+                )
+                res = await ws.receive_json()
+                self.assertEqual(res["success"], True)
+                self.assertEqual([m["id"] for m in res["data"]["messages"]], [2])
+                self.assertEqual(res["data"]["has_more"], False)
+
+                # Check if has_more is set when the page is full
+                await ws.send_json(
+                    {
+                        "type": "get_messages",
+                        "conversation_id": conversation_id,
+                        "limit": 1,
+                    }
+                )
+                res = await ws.receive_json()
+                self.assertEqual(res["success"], True)
+                self.assertEqual([m["id"] for m in res["data"]["messages"]], [2])
+                self.assertEqual(res["data"]["has_more"], True)
+
+                # Check if an invalid limit is rejected
+                await ws.send_json(
+                    {
+                        "type": "get_messages",
+                        "conversation_id": conversation_id,
+                        "limit": 0,
+                    }
+                )
+                res = await ws.receive_json()
+                self.assertEqual(res["success"], False)
+
+    async def test_search_messages(self):
+        tokens = {}
+        for username in ["abc", "pqr"]:
+            async with self.client.post(
+                "/auth/login", json={"username": username, "password": "xyz"}
+            ) as res:
+                self.assertEqual(res.status, 202)
+                tokens[username] = res.cookies.get("login-token").value
+
+        async with ClientSession(
+            self.client.make_url(""), cookies={"login-token": tokens["abc"]}
+        ) as session:
+            async with session.ws_connect("/ws") as ws:
+                # Create a private conversation, and one with pqr
+                convo_ids = []
+                for name, members in [("convo1", []), ("convo2", ["pqr"])]:
+                    await ws.send_json(
+                        {"type": "create_conversation", "name": name, "members": members}
+                    )
+                    res = await ws.receive_json()
+                    self.assertEqual(res["success"], True)
+                    convo_ids.append(res["data"]["id"])
+
+                for convo_id, content in [
+                    (convo_ids[0], "hello world"),
+                    (convo_ids[1], "hello there"),
+                    (convo_ids[1], "world peace, world peace"),
+                ]:
+                    await ws.send_json(
+                        {
+                            "type": "send_message",
+                            "conversation_id": convo_id,
+                            "content": content,
+                        }
+                    )
+                    res = await ws.receive_json()
+                    self.assertEqual(res["success"], True)
+
+                # Search in all the conversations, best match first
+                await ws.send_json({"type": "search_messages", "query": "world"})
+                res = await ws.receive_json()
+                self.assertEqual(res["success"], True)
+                self.assertEqual(res["type"], "search_messages")
+                self.assertEqual([m["id"] for m in res["data"]["messages"]], [3, 1])
+                self.assertEqual(res["data"]["has_more"], False)
+
+                # Search in a single conversation, one result per page
+                await ws.send_json(
+                    {
+                        "type": "search_messages",
+                        "query": "HELLO",
+                        "conversation_id": convo_ids[1],
+                        "limit": 1,
+                    }
+                )
+                res = await ws.receive_json()
+                self.assertEqual([m["id"] for m in res["data"]["messages"]], [2])
+                self.assertEqual(res["data"]["has_more"], False)
+
+                # Check if fts5 syntax in the query is taken as text
+                await ws.send_json(
+                    {"type": "search_messages", "query": 'hello" OR (world'}
+                )
+                res = await ws.receive_json()
+                self.assertEqual(res["success"], True)
+                self.assertEqual(res["data"]["messages"], [])
+
+                # Check if an empty query is rejected
+                await ws.send_json({"type": "search_messages", "query": "  "})
+                res = await ws.receive_json()
+                self.assertEqual(res["success"], False)
+
+        # Check if pqr only finds the messages of its conversations
+        async with ClientSession(
+            self.client.make_url(""), cookies={"login-token": tokens["pqr"]}
+        ) as session:
+            async with session.ws_connect("/ws") as ws:
+                await ws.send_json(
+                    {"type": "search_messages", "query": "world", "limit": 1}
+                )
+                res = await ws.receive_json()
+                self.assertEqual([m["id"] for m in res["data"]["messages"]], [3])
+                self.assertEqual(res["data"]["has_more"], False)
+
+                await ws.send_json(
+                    {
+                        "type": "search_messages",
+                        "query": "world",
+                        "conversation_id": convo_ids[0],
+                    }
+                )
+                res = await ws.receive_json()
+                self.assertEqual(res["success"], False)
+
     async def tearDownAsync(self):
         # Remove the dbpath
         shutil.rmtree(os.path.dirname(self.dbpath))
@@ -0,0 +1,141 @@
+import os
+import shutil
+
+from aiohttp.test_utils import AioHTTPTestCase, ClientSession
+
+from src.app import create_app
+
+
+class TestWSSyncEvent(AioHTTPTestCase):
+    async def get_application(self):
+        # Set a custom db path for the webapp
+        self.dbpath = ".test/this_is_a_test.db"
+        os.environ["DBPATH"] = self.dbpath
+        shutil.rmtree(os.path.dirname(self.dbpath), ignore_errors=True)
+
+        # Set a custom jwt secret
+        self.jwtsecret = "this is a jwt secret"
+        os.environ["JWTSECRET"] = self.jwtsecret
+
+        # Create the app
+        app = create_app()
+        return app
+
+    async def setUpAsync(self):
+        await super().setUpAsync()
+
+        # Add the usernames
+        async with self.client.post(
+            "/register",
+            json={"username": "abc", "password": "xyz", "fullname": "user1"},
+        ) as res:
+            self.assertEqual(res.status, 201)
+            self.assertEqual(await res.text(), "registered")
+
+        async with self.client.post(
+            "/register",
+            json={"username": "pqr", "password": "xyz", "fullname": "user2"},
+        ) as res:
+            self.assertEqual(res.status, 201)
+            self.assertEqual(await res.text(), "registered")
+
+        async with self.client.post(
+            "/register",
+            json={"username": "uvw", "password": "xyz", "fullname": "user3"},
+        ) as res:
+            self.assertEqual(res.status, 201)
+            self.assertEqual(await res.text(), "registered")
+
+    async def login(self, username: str) -> str:
+        async with self.client.post(
+            "/auth/login", json={"username": username, "password": "xyz"}
+        ) as res:
+            self.assertEqual(res.status, 202)
+            return res.cookies.get("login-token").value
+
+    async def test_sync(self):
+        abc_token = await self.login("abc")
+        pqr_token = await self.login("pqr")
+
+        async with ClientSession(
+            self.client.make_url(""), cookies={"login-token": abc_token}
+        ) as session:
+            async with session.ws_connect("/ws") as ws:
+                # Create a private conversation, and one with pqr
+                convo_ids = []
+                for name, members in [("convo1", []), ("convo2", ["pqr"])]:
+                    await ws.send_json(
+                        {
+                            "type": "create_conversation",
+                            "name": name,
+                            "members": members,
+                        }
+                    )
+                    res = await ws.receive_json()
+                    self.assertEqual(res["success"], True)
+                    convo_ids.append(res["data"]["id"])
+
+                # Send messages to both the conversations
+                for convo_id in [convo_ids[0], convo_ids[1], convo_ids[1]]:
+                    await ws.send_json(
+                        {
+                            "type": "send_message",
+                            "conversation_id": convo_id,
+                            "content": "hello",
+                        }
+                    )
+                    res = await ws.receive_json()
+                    self.assertEqual(res["success"], True)
+
+                # Sync everything, two entries per page
+                await ws.send_json({"type": "sync", "limit": 2})
+                res = await ws.receive_json()
+                self.assertEqual(res["success"], True)
+                self.assertEqual(res["type"], "sync")
+                data = res["data"]
+                self.assertEqual(data["has_more"], True)
+                self.assertEqual([c["id"] for c in data["conversations"]], convo_ids)
+                self.assertEqual(
+                    sorted(data["conversations"][1]["members"]), ["abc", "pqr"]
+                )
+                self.assertEqual([m["id"] for m in data["messages"]], [1, 2])
+                self.assertEqual(data["after"], 2)
+
+                # The next page starts at the returned cursors
+                await ws.send_json(
+                    {
+                        "type": "sync",
+                        "limit": 2,
+                        "after": data["after"],
+                        "conversations_after": data["conversations_after"],
+                    }
+                )
+                res = await ws.receive_json()
+                data = res["data"]
+                self.assertEqual(data["has_more"], False)
+                self.assertEqual(data["conversations"], [])
+                self.assertEqual([m["id"] for m in data["messages"]], [3])
+                self.assertEqual(data["messages"][0]["conversation_id"], convo_ids[1])
+
+                # Check if an invalid cursor is rejected
+                await ws.send_json({"type": "sync", "after": "1"})
+                res = await ws.receive_json()
+                self.assertEqual(res["success"], False)
+
+        # Check if pqr only gets the conversation it is part of
+        async with ClientSession(
+            self.client.make_url(""), cookies={"login-token": pqr_token}
+        ) as session:
+            async with session.ws_connect("/ws") as ws:
+                await ws.send_json({"type": "sync"})
+                res = await ws.receive_json()
+                data = res["data"]
+                self.assertEqual(
+                    [c["id"] for c in data["conversations"]], [convo_ids[1]]
+                )
+                self.assertEqual([m["id"] for m in data["messages"]], [2, 3])
+
+    async def tearDownAsync(self):
+        # Remove the dbpath
+        shutil.rmtree(os.path.dirname(self.dbpath))
+        return await super().tearDownAsync()
@@ -0,0 +1,59 @@
+import os
+import shutil
+
+from aiohttp.test_utils import AioHTTPTestCase
+
+from src.app import create_app
+
+
+class TestMetricsRoutes(AioHTTPTestCase):
+    async def get_application(self):
+        # Set a custom db path for the webapp
+        self.dbpath = ".test/this_is_a_test.db"
+        os.environ["DBPATH"] = self.dbpath
+        shutil.rmtree(os.path.dirname(self.dbpath), ignore_errors=True)
+
+        # Create the app
+        app = create_app()
+        return app
+
+    async def test_metrics(self):
+        # Make some database calls
+        async with self.client.post(
+            "/register", json={"username": "abc", "password": "xyz", "fullname": "123"}
+        ) as res:
+            self.assertEqual(res.status, 201)
+
+        async with self.client.get("/metrics") as res:
+            self.assertEqual(res.status, 200)
+            self.assertEqual(res.content_type, "text/plain")
+            text = await res.text()
+
+        # Check if the app values are part of the metrics
+        lines = text.splitlines()
+        self.assertIn("# TYPE chatapp_active_websockets gauge", lines)
+        self.assertIn("chatapp_active_websockets 0", lines)
+        self.assertIn("chatapp_passhasher_queue_depth 0", lines)
+        self.assertIn("# TYPE chatapp_ws_event_seconds histogram", lines)
+        self.assertIn("# TYPE chatapp_event_loop_lag_seconds gauge", lines)
+
+        # Check if the database calls are counted
+        self.assertTrue(
+            any(
+                l.startswith('chatapp_db_queries_total{op="write",query="insert_user"}')
+                for l in lines
+            )
+        )
+        self.assertTrue(
+            any(
+                l.startswith(
+                    'chatapp_db_query_seconds_bucket{op="write",query="insert_user",le="+Inf"}'
+                )
+                for l in lines
+            )
+        )
+
+    async def tearDownAsync(self):
+        # Remove the dbpath
+        shutil.rmtree(os.path.dirname(self.dbpath))
+        return await super().tearDownAsync()
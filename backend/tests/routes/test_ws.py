@@ -1,10 +1,16 @@
 import os
 import shutil
+import asyncio
+import sqlite3
 
 import jwt
+import aiohttp
+import unittest
 from aiohttp.test_utils import AioHTTPTestCase, ClientSession
 
 from src.app import create_app
+import src.routes.ws as ws_routes
+import src.utils.protocols as protocols
 
 
 class TestWSRoutes(AioHTTPTestCase):
@@ -18,6 +24,10 @@ class TestWSRoutes(AioHTTPTestCase):
         self.jwtsecret = "this is a jwt secret"
         os.environ["JWTSECRET"] = self.jwtsecret
 
+        # Flush presence often, with a short offline grace period
+        os.environ["PRESENCE_FLUSH_MS"] = "50"
+        os.environ["PRESENCE_GRACE_MS"] = "300"
+
         # Create the app
         app = create_app()
         return app
@@ -96,12 +106,25 @@ class TestWSRoutes(AioHTTPTestCase):
                 self.assertEqual(res["error"], "no type field found in the event")
 
                 # Check ping type
+                pings = ws_routes.EVENTS.get(type="ping")
                 await ws.send_json({"type": "ping"})
                 res = await ws.receive_json()
                 self.assertEqual(res["success"], True)
                 self.assertEqual(res["type"], "ping")
                 self.assertEqual(res["data"], "pong")
 
+                # Check if the event is counted and timed per type
+                self.assertEqual(ws_routes.EVENTS.get(type="ping"), pings + 1)
+                self.assertEqual(
+                    ws_routes.EVENT_LATENCY.count(type="ping"), pings + 1
+                )
+
+                # Send an event with an unhashable type
+                await ws.send_json({"type": ["ping"]})
+                res = await ws.receive_json()
+                self.assertEqual(res["success"], False)
+                self.assertEqual(res["error"], "no type field found in the event")
+
     async def test_ws_user_status(self):
         # Create a login session
         async with self.client.post(
@@ -164,6 +187,198 @@ class TestWSRoutes(AioHTTPTestCase):
                 self.assertEqual(res["data"]["username"], "pqr")
                 self.assertEqual(res["data"]["is_online"], False)
 
+                # Check if the offline status is also saved in the database
+                with sqlite3.connect(self.dbpath) as conn:
+                    cur = conn.execute(
+                        "SELECT is_online FROM users WHERE username = 'pqr'"
+                    )
+                    self.assertEqual(cur.fetchone()[0], 0)
+
+
+    async def test_ws_multi_device(self):
+        # Create the login sessions
+        tokens = {}
+        for username in ["abc", "pqr"]:
+            async with self.client.post(
+                "/auth/login", json={"username": username, "password": "xyz"}
+            ) as res:
+                self.assertEqual(res.status, 202)
+                tokens[username] = res.cookies.get("login-token").value
+
+        async with ClientSession(
+            self.client.make_url(""), cookies={"login-token": tokens["abc"]}
+        ) as abc_session, ClientSession(
+            self.client.make_url(""), cookies={"login-token": tokens["pqr"]}
+        ) as pqr_session:
+            async with abc_session.ws_connect("/ws") as abc_ws:
+                await abc_ws.send_json({"type": "add_contact", "contact_username": "pqr"})
+                res = await abc_ws.receive_json()
+                self.assertEqual(res["success"], True)
+
+                # Connect pqr from two devices, abc only hears about the first
+                phone = await pqr_session.ws_connect("/ws")
+                res = await abc_ws.receive_json()
+                self.assertEqual(res["data"], {"username": "pqr", "is_online": True})
+                laptop = await pqr_session.ws_connect("/ws")
+
+                # Check if both the devices get the conversation
+                await abc_ws.send_json(
+                    {"type": "create_conversation", "name": "convo", "members": ["pqr"]}
+                )
+                for ws in [abc_ws, phone, laptop]:
+                    res = await ws.receive_json()
+                    self.assertEqual(res["type"], "create_conversation")
+                    self.assertEqual(res["success"], True)
+
+                # Closing one device keeps pqr online
+                await phone.close()
+                await abc_ws.send_json({"type": "get_contacts"})
+                res = await abc_ws.receive_json()
+                self.assertEqual(res["type"], "get_contacts")
+                self.assertEqual(res["data"]["contacts"][0]["is_online"], True)
+
+                # Closing the last device makes pqr offline
+                await laptop.close()
+                res = await abc_ws.receive_json()
+                self.assertEqual(res["type"], "user_status")
+                self.assertEqual(res["data"], {"username": "pqr", "is_online": False})
+
+    async def test_ws_reconnect(self):
+        # Create the login sessions
+        tokens = {}
+        for username in ["abc", "pqr"]:
+            async with self.client.post(
+                "/auth/login", json={"username": username, "password": "xyz"}
+            ) as res:
+                self.assertEqual(res.status, 202)
+                tokens[username] = res.cookies.get("login-token").value
+
+        async with ClientSession(
+            self.client.make_url(""), cookies={"login-token": tokens["abc"]}
+        ) as abc_session, ClientSession(
+            self.client.make_url(""), cookies={"login-token": tokens["pqr"]}
+        ) as pqr_session:
+            async with abc_session.ws_connect("/ws") as abc_ws:
+                await abc_ws.send_json({"type": "add_contact", "contact_username": "pqr"})
+                res = await abc_ws.receive_json()
+                self.assertEqual(res["success"], True)
+
+                pqr_ws = await pqr_session.ws_connect("/ws")
+                res = await abc_ws.receive_json()
+                self.assertEqual(res["data"], {"username": "pqr", "is_online": True})
+
+                # A quick reconnect sends no offline/online pair
+                await pqr_ws.close()
+                pqr_ws = await pqr_session.ws_connect("/ws")
+                await asyncio.sleep(0.5)
+                await abc_ws.send_json({"type": "get_contacts"})
+                res = await abc_ws.receive_json()
+                self.assertEqual(res["type"], "get_contacts")
+                self.assertEqual(res["data"]["contacts"][0]["is_online"], True)
+
+                # Staying away longer than the grace period makes pqr offline
+                await pqr_ws.close()
+                res = await abc_ws.receive_json()
+                self.assertEqual(res["type"], "user_status")
+                self.assertEqual(res["data"], {"username": "pqr", "is_online": False})
+
+                # Check if the flush saved the offline status
+                with sqlite3.connect(self.dbpath) as conn:
+                    cur = conn.execute(
+                        "SELECT is_online FROM users WHERE username = 'pqr'"
+                    )
+                    self.assertEqual(cur.fetchone()[0], 0)
+
+    async def test_ws_batch(self):
+        async with self.client.post(
+            "/auth/login", json={"username": "abc", "password": "xyz"}
+        ) as res:
+            self.assertEqual(res.status, 202)
+            login_token = res.cookies.get("login-token").value
+
+        async with ClientSession(
+            self.client.make_url(""), cookies={"login-token": login_token}
+        ) as session:
+            async with session.ws_connect("/ws") as ws:
+                # Send a few events in one frame
+                await ws.send_json(
+                    {
+                        "type": "batch",
+                        "events": [
+                            {"id": "a", "event": {"type": "self"}},
+                            {"id": 2, "event": {"type": "get_contacts"}},
+                            {"id": "c", "event": {"type": "get_messages"}},
+                            {"id": "d", "event": {"type": "batch", "events": []}},
+                        ],
+                    }
+                )
+
+                # Check if all the replies come back in one frame, in order
+                res = await ws.receive_json()
+                self.assertEqual(res["success"], True)
+                self.assertEqual(res["type"], "batch")
+                self.assertEqual([r["id"] for r in res["data"]], ["a", 2, "c", "d"])
+                responses = [r["responses"] for r in res["data"]]
+                self.assertEqual(responses[0][0]["type"], "self")
+                self.assertEqual(responses[0][0]["data"]["username"], "abc")
+                self.assertEqual(responses[1][0]["type"], "get_contacts")
+                self.assertEqual(responses[1][0]["success"], True)
+                self.assertEqual(responses[2][0]["success"], False)
+                self.assertEqual(responses[3][0]["error"], "a batch cannot be nested")
+
+                # Check if an invalid envelope is rejected
+                await ws.send_json({"type": "batch", "events": [{"event": {}}]})
+                res = await ws.receive_json()
+                self.assertEqual(res["success"], False)
+                self.assertEqual(res["type"], "batch")
+
+    @unittest.skipIf(protocols.msgpack is None, "msgpack is not installed")
+    async def test_ws_msgpack(self):
+        msgpack = protocols.msgpack
+        async with self.client.post(
+            "/auth/login", json={"username": "abc", "password": "xyz"}
+        ) as res:
+            self.assertEqual(res.status, 202)
+            login_token = res.cookies.get("login-token").value
+
+        async with ClientSession(
+            self.client.make_url(""), cookies={"login-token": login_token}
+        ) as session:
+            # Check if the subprotocol is negotiated
+            async with session.ws_connect("/ws", protocols=("msgpack",)) as ws:
+                self.assertEqual(ws.protocol, "msgpack")
+
+                # Direct replies are msgpack encoded
+                await ws.send_bytes(msgpack.packb({"type": "ping"}))
+                msg = await ws.receive()
+                self.assertEqual(msg.type, aiohttp.WSMsgType.BINARY)
+                res = msgpack.unpackb(msg.data)
+                self.assertEqual(res["type"], "ping")
+                self.assertEqual(res["success"], True)
+
+                # Broadcasts are msgpack encoded too
+                await ws.send_bytes(
+                    msgpack.packb(
+                        {"type": "create_conversation", "name": "convo", "members": []}
+                    )
+                )
+                msg = await ws.receive()
+                self.assertEqual(msg.type, aiohttp.WSMsgType.BINARY)
+                res = msgpack.unpackb(msg.data)
+                self.assertEqual(res["type"], "create_conversation")
+                self.assertEqual(res["data"]["members"], ["abc"])
+
+                # Check if an invalid payload is rejected
+                await ws.send_bytes(b"\xc1")
+                res = msgpack.unpackb((await ws.receive()).data)
+                self.assertEqual(res["error"], "invalid msgpack event")
+
+            # Without the subprotocol everything stays json
+            async with session.ws_connect("/ws") as ws:
+                self.assertEqual(ws.protocol, None)
+                await ws.send_json({"type": "ping"})
+                res = await ws.receive_json()
+                self.assertEqual(res["type"], "ping")
 
     async def tearDownAsync(self):
         # Remove the dbpath
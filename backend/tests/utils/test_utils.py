@@ -0,0 +1,42 @@
+import json
+import time
+import asyncio
+import unittest
+
+import src.utils.utils as utils
+from src.utils.fanout import FANOUT_FAILURES
+
+
+class FakeWS:
+    # Records the sent payloads, and takes delay seconds per send
+    def __init__(self, delay: float = 0):
+        self.delay = delay
+        self.sent = []
+
+    async def send_frame(self, frame):
+        await asyncio.sleep(self.delay)
+        self.sent.append(json.loads(frame.encode("json")))
+
+
+class TestBroadcast(unittest.IsolatedAsyncioTestCase):
+    async def test_broadcast(self):
+        wss = [FakeWS(0.05) for _ in range(20)]
+
+        # Check if the sends happen concurrently
+        start = time.perf_counter()
+        await utils.broadcast(wss, "ping", "pong")
+        self.assertLess(time.perf_counter() - start, 0.5)
+        for ws in wss:
+            self.assertEqual(
+                ws.sent, [{"success": True, "type": "ping", "data": "pong"}]
+            )
+
+    async def test_broadcast_timeout(self):
+        slow, fast = FakeWS(10), FakeWS()
+        failures = FANOUT_FAILURES.get(reason="timeout")
+
+        # Check if a slow recipient doesn't hold back the others
+        await utils.broadcast([slow, fast], "ping", "pong", timeout=0.1)
+        self.assertEqual(slow.sent, [])
+        self.assertEqual(len(fast.sent), 1)
+        self.assertEqual(FANOUT_FAILURES.get(reason="timeout"), failures + 1)